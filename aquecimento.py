@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+from database import conexao_compartilhada
+from main import (
+    CORES_POR_TIPO,
+    ESCOPOS,
+    periodo_padrao,
+    progress_figure,
+    progress_page_size,
+    query_data,
+    query_options,
+    query_version,
+    timeline_figure,
+)
+from queries import criar_filtros
+
+# Aquecimento do processo do painel antes da primeira sessão: carrega os módulos pesados e
+# preenche o cache de consultas e de gráficos para o estado padrão dos filtros (últimos 30 dias,
+# "Todos"), que é o que a primeira página exibe. O cache é do processo, então o script do
+# Streamlit encontra os resultados prontos desde que o servidor seja iniciado por este módulo.
+AQUECER_CACHES = os.environ.get('PNP_AQUECER_CACHES', '1') == '1'
+
+# Function to pre-populate the query and chart caches for the default filter state, with the
+# same cache keys used by the page. Returns the filters warmed, or None when there is no data.
+def aquecer_caches(escopos=ESCOPOS):
+    conn = conexao_compartilhada.cursor()
+    try:
+        versao = query_version(conn)
+        min_date, max_date, _ = query_options(conn, versao)
+        if min_date is None:
+            return None
+        filtros = criar_filtros(*periodo_padrao(min_date, max_date), ['Todos'], ['Todos'])
+        dados = query_data(conn, filtros, versao=versao)
+    finally:
+        conn.close()
+    if dados is None:
+        return None
+
+    # Visão Geral (sem escopo) e a visão de cada escopo
+    for escopo in [None] + list(escopos):
+        timeline_figure(dados['linha_do_tempo'], CORES_POR_TIPO, filtros, versao, escopo)
+        top_n = progress_page_size(dados['progresso_instituicao'], 'Instituição', CORES_POR_TIPO, filtros, versao, escopo)
+        progress_figure(dados['progresso_instituicao'], 'Instituição', CORES_POR_TIPO, filtros, versao, escopo, 1, top_n)
+    return filtros
+
+if __name__ == '__main__':
+    # Uso: python aquecimento.py [opções do streamlit run], no lugar de "streamlit run main.py"
+    from streamlit.web import cli
+
+    if AQUECER_CACHES:
+        inicio = time.perf_counter()
+        try:
+            filtros = aquecer_caches()
+            if filtros is not None:
+                print(f"Caches aquecidos para {filtros.data_inicial} a {filtros.data_final} "
+                      f"em {time.perf_counter() - inicio:.1f}s.")
+        except Exception as e:
+            # Sem aquecimento o painel funciona normalmente, apenas com a primeira sessão mais lenta
+            print(f"Erro ao aquecer os caches: {e}")
+
+    sys.argv = ['streamlit', 'run', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')] + sys.argv[1:]
+    sys.exit(cli.main())
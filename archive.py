@@ -0,0 +1,140 @@
+import argparse
+import os
+import shutil
+from datetime import date
+
+import duckdb
+
+# Arquivo histórico em Parquet, um diretório por data de processamento (data=AAAA-MM-DD).
+# Com PNP_ARQUIVO_POR_INSTITUICAO=1 cada data é subdividida também por Instituição;
+# a opção vale para o arquivo inteiro, pois o layout das partições precisa ser uniforme.
+ARCHIVE_DIR = os.environ.get('PNP_ARCHIVE_DIR', 'data/parquet')
+POR_INSTITUICAO = os.environ.get('PNP_ARQUIVO_POR_INSTITUICAO', '0') == '1'
+
+def _diretorio_data(data_processamento, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f'data={data_processamento.isoformat()}')
+
+# Function to list the processing dates already present in the archive
+def datas_arquivadas(archive_dir=ARCHIVE_DIR):
+    if not os.path.isdir(archive_dir):
+        return []
+    datas = []
+    for nome in os.listdir(archive_dir):
+        if nome.startswith('data=') and not nome.endswith('.tmp'):
+            datas.append(date.fromisoformat(nome[len('data='):]))
+    return sorted(datas)
+
+# Function to write one daily snapshot of pnp_data as compressed Parquet
+def arquivar_snapshot(conn, data_processamento, archive_dir=ARCHIVE_DIR, por_instituicao=POR_INSTITUICAO):
+    destino = _diretorio_data(data_processamento, archive_dir)
+    temporario = f'{destino}.tmp'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    consulta = 'SELECT * FROM pnp_data WHERE "Data do Processamento" = $data'
+    if por_instituicao:
+        # Chave de partição sem acentos/espaços; a coluna "Instituição" continua nos arquivos
+        conn.execute(f"""
+        COPY (SELECT *, "Instituição" AS instituicao FROM ({consulta})) TO '{temporario}'
+            (FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (instituicao), OVERWRITE_OR_IGNORE)
+        """, {'data': data_processamento})
+    else:
+        conn.execute(f"""
+        COPY ({consulta}) TO '{os.path.join(temporario, 'snapshot.parquet')}'
+            (FORMAT PARQUET, COMPRESSION ZSTD)
+        """, {'data': data_processamento})
+
+    # Substitui a partição da data de uma vez, para que leitores nunca vejam arquivos parciais
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporario, destino)
+    return destino
+
+# Function to archive every processing date missing from the archive
+def arquivar_pendentes(conn, archive_dir=ARCHIVE_DIR, por_instituicao=POR_INSTITUICAO):
+    arquivadas = set(datas_arquivadas(archive_dir))
+    datas = [linha[0] for linha in conn.execute(
+        'SELECT DISTINCT "Data do Processamento" FROM pnp_fato ORDER BY 1').fetchall()]
+    pendentes = [data for data in datas if data not in arquivadas]
+    for data in pendentes:
+        arquivar_snapshot(conn, data, archive_dir, por_instituicao)
+    return pendentes
+
+# Function to register the archive as the temporary view pnp_arquivo.
+# Filtering by the "data" partition column prunes the files read to the requested dates.
+def registrar_arquivo(conn, archive_dir=ARCHIVE_DIR):
+    if not datas_arquivadas(archive_dir):
+        return False
+    padrao = os.path.join(archive_dir, 'data=*', '**', '*.parquet')
+    conn.execute(f"""
+    CREATE OR REPLACE TEMP VIEW pnp_arquivo AS
+        SELECT * FROM read_parquet('{padrao}', hive_partitioning = true, union_by_name = true)
+    """)
+    return True
+
+# Function to remove the raw daily CSV files whose snapshot is already archived
+def remover_csv_arquivados(data_dir='data', archive_dir=ARCHIVE_DIR):
+    removidos = []
+    for data in datas_arquivadas(archive_dir):
+        caminho = os.path.join(data_dir, f'dados-{data.isoformat()}.csv')
+        if os.path.exists(caminho):
+            os.remove(caminho)
+            removidos.append(caminho)
+    return removidos
+
+# Function to delete from the fact table the raw rows of archived dates older than the retention window.
+# The dashboard keeps the full history through the rollup tables and the archive.
+def descartar_detalhe_antigo(conn, dias, archive_dir=ARCHIVE_DIR):
+    arquivadas = datas_arquivadas(archive_dir)
+    ultima_data = conn.execute('SELECT MAX("Data do Processamento") FROM pnp_fato').fetchone()[0]
+    if ultima_data is None:
+        return []
+    antigas = [data for data in arquivadas if (ultima_data - data).days > dias]
+    if antigas:
+        conn.execute('DELETE FROM pnp_fato WHERE "Data do Processamento" IN (SELECT unnest(?))', [antigas])
+        conn.execute('CHECKPOINT')
+    return antigas
+
+if __name__ == '__main__':
+    from queries import consultar_arquivo, criar_filtros
+
+    parser = argparse.ArgumentParser(description="Arquiva os snapshots em Parquet ou consulta o arquivo.")
+    parser.add_argument('--remover-csv', action='store_true', help="remove os CSVs diários já arquivados")
+    parser.add_argument('--manter-dias', type=int, default=None,
+                        help="remove da tabela de fatos o detalhe arquivado mais antigo que N dias")
+    parser.add_argument('--consultar', action='store_true',
+                        help="consulta o detalhe do arquivo (sem arquivar), com os filtros abaixo")
+    parser.add_argument('--data-inicial', type=date.fromisoformat, default=None)
+    parser.add_argument('--data-final', type=date.fromisoformat, default=None)
+    parser.add_argument('--instituicao', action='append', help="pode ser repetido")
+    parser.add_argument('--unidade', action='append', help="pode ser repetido")
+    parser.add_argument('--saida', help="arquivo CSV com o resultado da consulta (padrão: imprime na tela)")
+    args = parser.parse_args()
+
+    if args.consultar:
+        # A consulta lê somente os arquivos Parquet, sem abrir o banco
+        conn = duckdb.connect()
+        try:
+            detalhe = consultar_arquivo(conn, criar_filtros(args.data_inicial, args.data_final,
+                                                            args.instituicao, args.unidade))
+        finally:
+            conn.close()
+        if args.saida:
+            detalhe.to_csv(args.saida, index=False)
+            print(f"{len(detalhe)} linha(s) gravada(s) em {args.saida}.")
+        else:
+            print(detalhe.to_string(index=False))
+    else:
+        from worker import executar_manutencao
+
+        # Aplicado a uma cópia do banco, publicada ao final (como numa carga)
+        def manutencao(conn):
+            datas = arquivar_pendentes(conn)
+            print(f"{len(datas)} snapshot(s) arquivado(s) em {ARCHIVE_DIR}.")
+            if args.remover_csv:
+                removidos = remover_csv_arquivados()
+                print(f"{len(removidos)} arquivo(s) CSV removido(s).")
+            if args.manter_dias is not None:
+                descartadas = descartar_detalhe_antigo(conn, args.manter_dias)
+                print(f"Detalhe de {len(descartadas)} data(s) removido(s) da tabela de fatos.")
+
+        executar_manutencao(manutencao)
@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Benchmark do dashboard e do pipeline sobre históricos sintéticos (dados_sinteticos.py).
+# Mede latência (mediana e mínimo de N repetições) e pico de memória alocada pelo Python
+# (tracemalloc) de cada função, da renderização completa da página, da inicialização de um
+# novo processo do painel (com e sem aquecimento dos caches) e do pipeline de carga.
+# Os resultados são acrescentados a um arquivo JSON Lines para comparação entre versões.
+
+RESULTADOS_PATH = 'benchmark_resultados.jsonl'
+
+# Function to measure the latency and the Python peak memory of a callable.
+# Latency comes from untraced repetitions; the peak from one extra run under tracemalloc,
+# which would otherwise slow the timed runs down. The setup callable runs before every
+# run, outside the measurement.
+def medir(funcao, repeticoes=3, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    if preparar is not None:
+        preparar()
+    tracemalloc.start()
+    try:
+        funcao()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return resultado, {
+        'latencia_mediana_s': round(statistics.median(tempos), 4),
+        'latencia_min_s': round(min(tempos), 4),
+        'pico_memoria_mb': round(pico / 2 ** 20, 2),
+    }
+
+# Function to read the peak resident memory of the current process (VmHWM, in MB).
+# getrusage's ru_maxrss is not used: a child started by subprocess inherits the
+# high-water mark of its parent on Linux. Returns None where /proc is not available.
+def pico_rss_mb():
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return round(int(linha.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    return None
+
+# Function to benchmark the dashboard functions against a seeded database
+def medir_funcoes(repeticoes=3):
+    import database
+    import main
+    from queries import criar_filtros, consultar_opcoes
+
+    conn = database.conexao_compartilhada.cursor()
+    cache = database.cache_resultados
+    data_inicial, data_final, hierarquia = consultar_opcoes(conn)
+    tipos = ['Inconsistente RA', 'Alterado RA', 'Validado RA', 'Inconsistente PI',
+             'Alterado PI', 'Validado PI', 'Alterado RE', 'Validado RE']
+    cores_por_tipo = {tipo: '#000000' for tipo in tipos}
+
+    cenarios = {
+        'todos': criar_filtros(data_inicial, data_final),
+        'uma_instituicao': criar_filtros(data_inicial, data_final, [hierarquia['Instituição'].iloc[0]]),
+    }
+    resultados = {}
+    for cenario, filtros in cenarios.items():
+        incluir_unidades = len(filtros.instituicoes) == 1
+        dados, resultados[f'{cenario}/query_data'] = medir(
+            lambda: main.query_data(conn, filtros, incluir_unidades), repeticoes, cache.limpar)
+        _, resultados[f'{cenario}/process_data'] = medir(
+            lambda: main.process_data(dados['detalhe']), repeticoes)
+        _, resultados[f'{cenario}/create_timeline_chart'] = medir(
+            lambda: main.create_timeline_chart(dados['linha_do_tempo'], cores_por_tipo), repeticoes)
+        _, resultados[f'{cenario}/create_progress_chart(Instituição)'] = medir(
+            lambda: main.create_progress_chart(dados['progresso_instituicao'], 'Instituição', cores_por_tipo), repeticoes)
+        if incluir_unidades:
+            _, resultados[f'{cenario}/create_progress_chart(Unidade)'] = medir(
+                lambda: main.create_progress_chart(dados['progresso_unidade'], 'Unidade', cores_por_tipo), repeticoes)
+        resumo, resultados[f'{cenario}/calcular_resumo'] = medir(
+            lambda: main.calcular_resumo(dados['resumo'], tipos), repeticoes)
+        _, resultados[f'{cenario}/create_summary_cards'] = medir(
+            lambda: main.create_summary_cards(resumo, tipos), repeticoes)
+    conn.close()
+    return resultados
+
+# Function to benchmark a full page render (cold and warm cache) through the Streamlit test runner
+def medir_renderizacao(repeticoes=3):
+    from streamlit.testing.v1 import AppTest
+    import database
+
+    # A página usa caminhos relativos à raiz do projeto (logo.svg)
+    diretorio_anterior = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    def renderizar():
+        app = AppTest.from_file('main.py', default_timeout=600)
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        return app
+
+    try:
+        _, frio = medir(renderizar, repeticoes, database.cache_resultados.limpar)
+        _, quente = medir(renderizar, repeticoes)
+    finally:
+        os.chdir(diretorio_anterior)
+    return {'render_completo/cache_frio': frio, 'render_completo/cache_quente': quente}
+
+# Script executed in a fresh process for each startup run: imports the page, optionally warms
+# the caches (aquecimento.py) and renders the first page, as the first session of a new server would.
+SCRIPT_INICIALIZACAO = """
+import json, sys, time
+from benchmark import pico_rss_mb
+inicio = time.perf_counter()
+import main
+importacao = time.perf_counter() - inicio
+aquecimento = None
+if sys.argv[1] == '1':
+    from aquecimento import aquecer_caches
+    inicio = time.perf_counter()
+    aquecer_caches()
+    aquecimento = round(time.perf_counter() - inicio, 4)
+from streamlit.testing.v1 import AppTest
+inicio = time.perf_counter()
+app = AppTest.from_file(sys.argv[2], default_timeout=600)
+app.run()
+if app.exception:
+    raise RuntimeError(app.exception[0].value)
+print(json.dumps({
+    'importacao_s': round(importacao, 4),
+    'aquecimento_s': aquecimento,
+    'primeira_renderizacao_s': round(time.perf_counter() - inicio, 4),
+    'pico_rss_mb': pico_rss_mb(),
+}))
+"""
+
+# Function to benchmark the startup of a new dashboard process, without and with the cache
+# warm-up (median of the repetitions, each one in a fresh process)
+def medir_inicializacao(repeticoes=3):
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    ambiente = dict(os.environ, PYTHONPATH=diretorio)
+    resultados = {}
+    for nome, aquecer in (('inicializacao/sem_aquecimento', '0'), ('inicializacao/com_aquecimento', '1')):
+        execucoes = []
+        for _ in range(repeticoes):
+            saida = subprocess.run([sys.executable, '-c', SCRIPT_INICIALIZACAO, aquecer, os.path.join(diretorio, 'main.py')],
+                                   cwd=diretorio, env=ambiente, capture_output=True, text=True, check=True).stdout
+            execucoes.append(json.loads(saida.strip().splitlines()[-1]))
+        resultados[nome] = {chave: statistics.median(execucao[chave] for execucao in execucoes)
+                            if execucoes[0][chave] is not None else None for chave in execucoes[0]}
+    return resultados
+
+# Script executed in a fresh process for each pipeline run (the environment is read at import time).
+# Its peak resident memory includes DuckDB's native memory.
+SCRIPT_PIPELINE = """
+import json, time
+from benchmark import pico_rss_mb
+from get_data_from_metabase import run_pipeline
+inicio = time.perf_counter()
+run_pipeline()
+print(json.dumps({
+    'latencia_s': round(time.perf_counter() - inicio, 4),
+    'pico_rss_mb': pico_rss_mb(),
+}))
+"""
+
+# Function to benchmark run_pipeline: a backfill of every synthetic CSV, then a rerun
+# where every snapshot is unchanged
+def medir_pipeline(parametros):
+    from dados_sinteticos import escrever_csvs
+    from metabase_local import iniciar_servidor
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminhos = escrever_csvs(os.path.join(diretorio, 'data'), data_final=datetime.now().date(), **parametros)
+        # O último snapshot é o de hoje, entregue pelo servidor no lugar do Metabase
+        servidor = iniciar_servidor({71: caminhos[-1]})
+        ambiente = dict(os.environ,
+                        PYTHONPATH=os.path.dirname(os.path.abspath(__file__)),
+                        PNP_DB_PATH=os.path.join(diretorio, 'db.duckdb'),
+                        PNP_ARCHIVE_DIR=os.path.join(diretorio, 'data', 'parquet'),
+                        METABASE_URL=f'http://127.0.0.1:{servidor.server_address[1]}')
+        try:
+            for nome in ('run_pipeline/carga_completa', 'run_pipeline/sem_alteracoes'):
+                saida = subprocess.run([sys.executable, '-c', SCRIPT_PIPELINE], cwd=diretorio, env=ambiente,
+                                       capture_output=True, text=True, check=True).stdout
+                resultados[nome] = json.loads(saida.strip().splitlines()[-1])
+        finally:
+            servidor.shutdown()
+    return resultados
+
+# Function to identify the code version being measured
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+# Function to append a benchmark run to the results file
+def salvar_resultados(registro, caminho=RESULTADOS_PATH):
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+# Function to print the results as a table
+def imprimir_resultados(resultados):
+    largura = max(len(nome) for nome in resultados)
+    for nome, medidas in resultados.items():
+        valores = "  ".join(f"{chave}={valor}" for chave, valor in medidas.items())
+        print(f"{nome:<{largura}}  {valores}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark do dashboard e do pipeline com dados sintéticos.")
+    parser.add_argument('--instituicoes', type=int, default=65)
+    parser.add_argument('--unidades', type=int, default=700)
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--db', help="banco já populado (por padrão um banco sintético temporário é gerado)")
+    parser.add_argument('--pipeline-dias', type=int, default=30,
+                        help="dias de CSV carregados no benchmark do pipeline (0 para não medir)")
+    parser.add_argument('--sem-render', action='store_true', help="não mede a renderização completa")
+    parser.add_argument('--sem-inicializacao', action='store_true',
+                        help="não mede a inicialização de um novo processo do painel")
+    parser.add_argument('--saida', default=RESULTADOS_PATH)
+    args = parser.parse_args()
+
+    parametros = dict(instituicoes=args.instituicoes, unidades=args.unidades, semente=args.semente)
+    with tempfile.TemporaryDirectory() as diretorio:
+        # O dashboard lê DB_PATH na importação de database.py, antes de qualquer módulo do projeto
+        db_path = args.db or os.path.join(diretorio, 'db.duckdb')
+        os.environ['PNP_DB_PATH'] = db_path
+        if args.db is None:
+            from dados_sinteticos import semear_banco
+
+            inicio = time.perf_counter()
+            semear_banco(db_path, dias=args.dias, **parametros)
+            print(f"Banco sintético gerado em {time.perf_counter() - inicio:.1f}s.")
+
+        # Avisos de execução fora do servidor do Streamlit (cards chamados diretamente)
+        from streamlit.logger import set_log_level
+        set_log_level('error')
+
+        resultados = medir_funcoes(args.repeticoes)
+        if not args.sem_render:
+            resultados.update(medir_renderizacao(args.repeticoes))
+        if not args.sem_inicializacao:
+            resultados.update(medir_inicializacao(args.repeticoes))
+        import database
+        database.conexao_compartilhada.reabrir()
+    if args.pipeline_dias > 0:
+        resultados.update(medir_pipeline(dict(parametros, dias=args.pipeline_dias)))
+
+    imprimir_resultados(resultados)
+    salvar_resultados({
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'commit': versao_codigo(),
+        'python': platform.python_version(),
+        'parametros': dict(parametros, dias=args.dias, pipeline_dias=args.pipeline_dias,
+                           repeticoes=args.repeticoes, db=args.db),
+        'resultados': resultados,
+    }, args.saida)
+    print(f"Resultados acrescentados a {args.saida}.")
@@ -0,0 +1,134 @@
+import argparse
+import os
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from ingest import criar_tabelas
+from rollups import atualizar_agregados
+from schema import garantir_dimensoes, inserir_fatos
+from tendencias import atualizar_tendencias
+from validacao import COLUNAS
+
+# Gerador de históricos sintéticos do PNP, com o mesmo esquema e os mesmos valores
+# de escopo/situação da exportação do Metabase, para testes de carga e benchmarks.
+
+# Cabeçalho dos CSVs sintéticos, diferente dos rótulos do painel (as colunas são lidas por posição)
+CABECALHO_SINTETICO = ['nome_instituicao', 'unidade', 'escopo', 'situacao', 'total']
+
+# Escala típica do total por escopo, aproximada dos dados reais
+ESCOPOS = {
+    'Ciclo': 100,
+    'Curso': 10,
+    'Matrícula': 4000,
+}
+
+# Situação -> (probabilidade de a unidade ter a série, peso relativo do total, tendência diária)
+SITUACOES = {
+    'Inconsistente RA': (0.50, 0.50, 0.996),
+    'Alterado RA': (0.55, 1.00, 1.001),
+    'Validado RA': (0.50, 1.00, 1.002),
+    'Inconsistente PI': (0.01, 0.05, 0.996),
+    'Alterado PI': (0.03, 0.10, 1.001),
+    'Validado PI': (0.25, 0.80, 1.002),
+    'Alterado RE': (0.005, 0.10, 1.001),
+    'Validado RE': (0.005, 0.50, 1.002),
+}
+
+# Function to build the synthetic institution x unit hierarchy
+def gerar_hierarquia(instituicoes=65, unidades=700, semente=0):
+    rng = np.random.default_rng(semente)
+    nomes = [f"Instituto Federal Sintético {i + 1:03d}" for i in range(instituicoes)]
+    # Toda instituição tem ao menos uma unidade; as demais são sorteadas com tamanhos desiguais
+    pesos = rng.pareto(1.5, instituicoes) + 1
+    extras = rng.choice(instituicoes, size=max(0, unidades - instituicoes), p=pesos / pesos.sum())
+    por_instituicao = np.bincount(extras, minlength=instituicoes) + 1
+    linhas = [(nomes[i], f"Campus Sintético {i + 1:03d}-{j + 1:03d}")
+              for i in range(instituicoes) for j in range(por_instituicao[i])]
+    return pd.DataFrame(linhas[:max(unidades, instituicoes)], columns=['Instituição', 'Unidade'])
+
+# Function to draw the series (unit x escopo x situação) of a hierarchy, with their
+# initial totals and daily trends
+def gerar_series(hierarquia, semente=0):
+    rng = np.random.default_rng(semente + 1)
+    series = hierarquia.merge(pd.DataFrame({'Escopo da Inconsistência': list(ESCOPOS)}), how='cross')
+    series = series.merge(pd.DataFrame({'Situação da Inconsistência': list(SITUACOES)}), how='cross')
+
+    probabilidade, peso, tendencia = (series['Situação da Inconsistência'].map(
+        {situacao: valores[k] for situacao, valores in SITUACOES.items()}).to_numpy() for k in range(3))
+    sorteadas = rng.random(len(series)) < probabilidade
+    series = series[sorteadas].reset_index(drop=True)
+    escala = series['Escopo da Inconsistência'].map(ESCOPOS).to_numpy() * peso[sorteadas]
+
+    series['inicial'] = rng.lognormal(mean=np.log(escala), sigma=1.0)
+    series['tendencia'] = tendencia[sorteadas] * rng.normal(1.0, 0.0005, len(series))
+    return series
+
+# Function to generate the snapshots of every day, one frame per processing date,
+# with the CSV columns in the export order (rows with a zero total are omitted)
+def gerar_snapshots(instituicoes=65, unidades=700, dias=365, data_final=None, semente=0):
+    data_final = data_final or date.today()
+    series = gerar_series(gerar_hierarquia(instituicoes, unidades, semente), semente)
+    rng = np.random.default_rng(semente + 2)
+    for dia in range(dias):
+        data_processamento = data_final - timedelta(days=dias - 1 - dia)
+        totais = np.rint(series['inicial'] * series['tendencia'] ** dia
+                         * rng.normal(1.0, 0.02, len(series)).clip(0.9, 1.1)).astype('int64')
+        snapshot = series[COLUNAS[:-1]].assign(**{'Total de Inconsistências': totais})
+        yield data_processamento, snapshot[totais > 0].reset_index(drop=True)
+
+# Function to write the snapshots as data/dados-YYYY-MM-DD.csv files, as exported by the Metabase
+def escrever_csvs(data_dir, **parametros):
+    os.makedirs(data_dir, exist_ok=True)
+    caminhos = []
+    for data_processamento, snapshot in gerar_snapshots(**parametros):
+        caminho = os.path.join(data_dir, f'dados-{data_processamento.isoformat()}.csv')
+        snapshot.to_csv(caminho, index=False, header=CABECALHO_SINTETICO)
+        caminhos.append(caminho)
+    return caminhos
+
+# Function to seed a DuckDB file with the synthetic history (facts, dimensions, rollups and trends)
+def semear_banco(db_path, **parametros):
+    conn = duckdb.connect(database=db_path)
+    try:
+        criar_tabelas(conn)
+        datas = []
+        conn.execute("BEGIN TRANSACTION")
+        for data_processamento, snapshot in gerar_snapshots(**parametros):
+            conn.register('sintetico', snapshot)
+            conn.execute('DELETE FROM pnp_fato WHERE "Data do Processamento" = ?', [data_processamento])
+            garantir_dimensoes(conn, 'sintetico')
+            inserir_fatos(conn, 'sintetico', data_processamento)
+            conn.unregister('sintetico')
+            datas.append(data_processamento)
+        conn.execute("COMMIT")
+        atualizar_agregados(conn)
+        atualizar_tendencias(conn)
+        conn.execute("CHECKPOINT")
+        return datas
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera históricos sintéticos do PNP.")
+    parser.add_argument('--instituicoes', type=int, default=65)
+    parser.add_argument('--unidades', type=int, default=700)
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--data-final', type=date.fromisoformat, default=None)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--db', help="arquivo DuckDB a ser populado")
+    parser.add_argument('--csv-dir', help="diretório onde gravar os CSVs diários")
+    args = parser.parse_args()
+
+    parametros = dict(instituicoes=args.instituicoes, unidades=args.unidades, dias=args.dias,
+                      data_final=args.data_final, semente=args.semente)
+    if args.db:
+        datas = semear_banco(args.db, **parametros)
+        print(f"{len(datas)} snapshot(s) sintético(s) gravado(s) em {args.db}.")
+    if args.csv_dir:
+        caminhos = escrever_csvs(args.csv_dir, **parametros)
+        print(f"{len(caminhos)} arquivo(s) CSV sintético(s) gravado(s) em {args.csv_dir}.")
+    if not args.db and not args.csv_dir:
+        parser.error("informe --db e/ou --csv-dir")
@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+
+import duckdb
+
+DB_PATH = os.environ.get('PNP_DB_PATH', 'db.duckdb')
+
+# Function to identify the database file on disk; changes whenever a new ingest is written
+def assinatura_arquivo(db_path):
+    stat = os.stat(db_path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# Conexão somente leitura compartilhada pelo processo inteiro.
+# Cada chamada a cursor() devolve um cursor próprio (seguro por thread/sessão)
+# sobre a mesma instância do banco, reaberta quando o arquivo muda.
+class ConexaoCompartilhada:
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._assinatura = None
+
+    def cursor(self):
+        with self._lock:
+            assinatura = assinatura_arquivo(self.db_path)
+            if self._conn is None or assinatura != self._assinatura:
+                # A conexão anterior é liberada quando os cursores em uso terminarem.
+                # O arquivo é anexado a uma instância em memória própria: duckdb.connect()
+                # reaproveitaria a instância ainda aberta do mesmo caminho (o arquivo antigo).
+                self._conn = duckdb.connect(database=':memory:')
+                caminho = self.db_path.replace("'", "''")
+                self._conn.execute(f"ATTACH '{caminho}' AS pnp (READ_ONLY)")
+                self._assinatura = assinatura
+            cursor = self._conn.cursor()
+            cursor.execute("USE pnp")
+            return cursor
+
+    # Assinatura do arquivo aberto; muda a cada troca do banco publicada pela carga
+    @property
+    def assinatura(self):
+        return self._assinatura
+
+    def reabrir(self):
+        with self._lock:
+            self._conn = None
+            self._assinatura = None
+
+# Cache LRU de resultados de consultas, com tamanho limitado.
+# Todas as entradas são descartadas quando a versão dos dados muda
+# (nova carga), sem depender de TTL.
+class CacheResultados:
+    def __init__(self, max_itens=64):
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+        self._versao = None
+
+    def obter(self, chave, versao, calcular):
+        with self._lock:
+            if versao != self._versao:
+                self._itens.clear()
+                self._versao = versao
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                return self._itens[chave]
+
+        valor = calcular()
+
+        with self._lock:
+            if versao == self._versao:
+                self._itens[chave] = valor
+                self._itens.move_to_end(chave)
+                while len(self._itens) > self.max_itens:
+                    self._itens.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._versao = None
+
+    def __len__(self):
+        return len(self._itens)
+
+# Instâncias compartilhadas pelo processo (sobrevivem aos reruns do Streamlit)
+conexao_compartilhada = ConexaoCompartilhada()
+cache_resultados = CacheResultados(max_itens=int(os.environ.get('PNP_CACHE_MAX_ITENS', 64)))
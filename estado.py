@@ -0,0 +1,21 @@
+import json
+import os
+
+# Arquivos de estado em JSON guardados junto aos arquivos que descrevem (a extração dos cards
+# em data/, os relatórios gerados em relatorios/). A gravação é atômica, para que uma execução
+# interrompida nunca deixe um estado parcial.
+
+# Function to read a state file; a missing or unreadable file is an empty state
+def carregar_estado(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Function to write a state file atomically
+def salvar_estado(caminho, estado):
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
@@ -0,0 +1,116 @@
+import argparse
+import os
+import re
+import tempfile
+import unicodedata
+from dataclasses import replace
+from datetime import date
+
+from database import conexao_compartilhada
+from queries import criar_filtros, montar_consulta_exportacao
+
+# Exportação do detalhe filtrado (todos os escopos ou um escopo) sem passar pelo pandas:
+# CSV e Parquet são gravados pelo COPY do DuckDB; XLSX por um escritor em lotes
+# (openpyxl em modo write_only), lendo o resultado aos poucos do cursor.
+# Formato -> (extensão, tipo MIME, opções do COPY)
+FORMATOS = {
+    'CSV': ('csv', 'text/csv', "FORMAT CSV, HEADER"),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', "FORMAT PARQUET, COMPRESSION ZSTD"),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', None),
+}
+LINHAS_POR_LOTE = int(os.environ.get('PNP_EXPORTACAO_LOTE', 50000))
+
+# Limite de linhas de uma planilha do Excel (sem o cabeçalho)
+MAX_LINHAS_PLANILHA = 1048575
+
+# Function to turn a label (escopo, Instituição) into a lowercase ASCII file name part
+def nome_seguro(texto):
+    sem_acentos = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return re.sub(r'\W+', '_', sem_acentos.lower()).strip('_')
+
+# Function to build the download file name of an export
+def nome_arquivo(filtros, formato, escopo=None):
+    partes = ['pnp']
+    if filtros.data_inicial is not None:
+        partes.append(filtros.data_inicial.isoformat())
+    if filtros.data_final is not None:
+        partes.append(filtros.data_final.isoformat())
+    if escopo:
+        partes.append(nome_seguro(escopo))
+    return f"{'_'.join(partes)}.{FORMATOS[formato][0]}"
+
+# Function to write the result of a query to an XLSX file in batches, starting a new
+# sheet whenever one is full
+def escrever_xlsx(conn, sql, parametros, destino, linhas_por_lote=LINHAS_POR_LOTE):
+    # O openpyxl só é importado na exportação para Excel (fora do caminho de inicialização do painel)
+    from openpyxl import Workbook
+
+    cursor = conn.execute(sql, parametros)
+    cabecalho = [coluna[0] for coluna in cursor.description]
+    workbook = Workbook(write_only=True)
+
+    def nova_planilha():
+        planilha = workbook.create_sheet(f"Dados {len(workbook.worksheets) + 1}")
+        planilha.append(cabecalho)
+        return planilha
+
+    planilha, linhas = nova_planilha(), 0
+    for lote in iter(lambda: cursor.fetchmany(linhas_por_lote), []):
+        for linha in lote:
+            if linhas == MAX_LINHAS_PLANILHA:
+                planilha, linhas = nova_planilha(), 0
+            planilha.append(linha)
+            linhas += 1
+    workbook.save(destino)
+
+# Function to export the filtered detail (optionally restricted to one escopo) to a file
+def exportar(conn, filtros, formato, destino, escopo=None):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}")
+    if escopo:
+        filtros = replace(filtros, escopos=(escopo,))
+    sql, parametros = montar_consulta_exportacao(conn, filtros)
+    opcoes = FORMATOS[formato][2]
+    if opcoes is None:
+        escrever_xlsx(conn, sql, parametros, destino)
+    else:
+        caminho = destino.replace("'", "''")
+        conn.execute(f"COPY ({sql}) TO '{caminho}' ({opcoes})", parametros)
+    return destino
+
+# Function to generate an export in a temporary file and return its content.
+# The download button keeps the whole file in memory anyway, so the handle is not kept open.
+# Runs on its own cursor, so it can be called from the download thread.
+def gerar_arquivo(filtros, formato, escopo=None):
+    conn = conexao_compartilhada.cursor()
+    try:
+        descritor, destino = tempfile.mkstemp(suffix=f'.{FORMATOS[formato][0]}')
+        os.close(descritor)
+        try:
+            exportar(conn, filtros, formato, destino, escopo)
+            with open(destino, 'rb') as arquivo:
+                return arquivo.read()
+        finally:
+            os.remove(destino)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporta o detalhe filtrado das inconsistências.")
+    parser.add_argument('--formato', choices=list(FORMATOS), default='CSV')
+    parser.add_argument('--data-inicial', type=date.fromisoformat, default=None)
+    parser.add_argument('--data-final', type=date.fromisoformat, default=None)
+    parser.add_argument('--instituicao', action='append', help="pode ser repetido")
+    parser.add_argument('--unidade', action='append', help="pode ser repetido")
+    parser.add_argument('--escopo', default=None)
+    parser.add_argument('--saida', help="arquivo de destino (padrão: nome gerado a partir dos filtros)")
+    args = parser.parse_args()
+
+    filtros = criar_filtros(args.data_inicial, args.data_final, args.instituicao, args.unidade)
+    destino = args.saida or nome_arquivo(filtros, args.formato, args.escopo)
+    conn = conexao_compartilhada.cursor()
+    try:
+        exportar(conn, filtros, args.formato, destino, args.escopo)
+        print(f"Exportação gravada em {destino}.")
+    finally:
+        conn.close()
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from estado import carregar_estado, salvar_estado
+
+# Extração dos cards do Metabase, em paralelo e com sessão HTTP compartilhada.
+# PNP_CARTOES lista os cards como prefixo:id separados por vírgula; cada card é gravado em
+# data/<prefixo>-AAAA-MM-DD.csv (o prefixo "dados" é o snapshot carregado no banco).
+CARTOES = os.environ.get('PNP_CARTOES', 'dados:71')
+MAX_CONCORRENCIA = int(os.environ.get('PNP_METABASE_CONCORRENCIA', 4))
+TIMEOUT_CONEXAO = float(os.environ.get('PNP_METABASE_TIMEOUT_CONEXAO', 10))
+TIMEOUT_LEITURA = float(os.environ.get('PNP_METABASE_TIMEOUT_LEITURA', 300))
+TENTATIVAS = int(os.environ.get('PNP_METABASE_TENTATIVAS', 4))
+ESPERA_BASE = float(os.environ.get('PNP_METABASE_ESPERA_BASE', 1.0))
+CHUNK_SIZE = 1024 * 1024
+
+# Respostas que justificam uma nova tentativa
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+# Card do Metabase exportado como CSV
+@dataclass(frozen=True)
+class Cartao:
+    prefixo: str
+    card_id: int
+
+# Function to parse the card registry ("prefixo:id,prefixo:id")
+def carregar_cartoes(configuracao=CARTOES):
+    cartoes = []
+    for item in configuracao.split(','):
+        if item.strip():
+            prefixo, card_id = item.strip().split(':')
+            cartoes.append(Cartao(prefixo.strip(), int(card_id)))
+    return cartoes
+
+# Function to create the HTTP session shared by the downloads, with one pooled connection per worker
+def criar_sessao(max_concorrencia=MAX_CONCORRENCIA):
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=max_concorrencia, pool_maxsize=max_concorrencia)
+    sessao.mount('http://', adaptador)
+    sessao.mount('https://', adaptador)
+    sessao.headers.update({
+        'Content-Type': 'application/json',
+        'x-api-key': os.environ.get('METABASE_API_KEY') or '',
+    })
+    return sessao
+
+# Estado das últimas extrações (ETag, hash e arquivo de cada card), guardado junto aos CSVs
+def _estado_path(data_dir):
+    return os.path.join(data_dir, '.cartoes.json')
+
+# Function to compute the wait before a new attempt: exponential backoff with jitter,
+# or the server's Retry-After when present
+def _espera(tentativa, resposta=None, espera_base=ESPERA_BASE):
+    if resposta is not None and resposta.headers.get('Retry-After', '').isdigit():
+        return float(resposta.headers['Retry-After'])
+    return espera_base * 2 ** tentativa * random.uniform(0.5, 1.5)
+
+# Function to download one card to its destination file. The body is streamed to a .part file
+# while hashed; an export equal to the previous one (304 for the stored ETag, or same hash)
+# does not replace the file. Returns the new state of the card and whether it changed.
+def baixar_cartao(sessao, base_url, cartao, destino, anterior, tentativas=TENTATIVAS,
+                  timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA)):
+    # O ETag só é enviado se houver um arquivo a reaproveitar: o anterior pode ter sido removido
+    # pelo arquivamento (archive.py --remover-csv) ou movido para a quarentena
+    reaproveitavel = os.path.exists(destino) or os.path.exists(anterior.get('arquivo', ''))
+    cabecalhos = {'If-None-Match': anterior['etag']} if anterior.get('etag') and reaproveitavel else {}
+    url = f"{base_url}/api/card/{cartao.card_id}/query/csv"
+    partial_path = f'{destino}.part'
+    for tentativa in range(tentativas):
+        resposta = None
+        try:
+            with sessao.post(url, headers=cabecalhos, stream=True, timeout=timeout) as resposta:
+                if resposta.status_code == 304:
+                    # Export igual ao anterior: reaproveita o último arquivo para a data de hoje
+                    if not os.path.exists(destino):
+                        shutil.copyfile(anterior['arquivo'], destino)
+                    return dict(anterior, arquivo=destino), False
+                if resposta.status_code in STATUS_TRANSITORIOS:
+                    raise requests.HTTPError(f"HTTP {resposta.status_code}", response=resposta)
+                if resposta.status_code != 200:
+                    raise RuntimeError(f"HTTP {resposta.status_code} {resposta.reason}")
+
+                sha256 = hashlib.sha256()
+                with open(partial_path, 'wb') as f:
+                    for chunk in resposta.iter_content(chunk_size=CHUNK_SIZE):
+                        sha256.update(chunk)
+                        f.write(chunk)
+        except requests.RequestException as e:
+            # Inclui a conexão encerrada no meio do corpo (ChunkedEncodingError)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            if tentativa == tentativas - 1:
+                raise
+            espera = _espera(tentativa, resposta)
+            print(f"Card {cartao.card_id}: {e}; nova tentativa em {espera:.1f}s.")
+            time.sleep(espera)
+            continue
+
+        hash_atual = sha256.hexdigest()
+        estado = {'etag': resposta.headers.get('ETag'), 'hash': hash_atual, 'arquivo': destino,
+                  'baixado_em': datetime.now().isoformat(timespec='seconds')}
+        if hash_atual == anterior.get('hash') and os.path.exists(destino):
+            os.remove(partial_path)
+            return estado, False
+        os.replace(partial_path, destino)
+        return estado, True
+
+# Function to download every card of the registry concurrently (at most max_concorrencia
+# requests at a time). Returns {prefixo: (arquivo, alterado)}; failed cards are reported and
+# left out, without stopping the others.
+def extrair_cartoes(base_url, data_dir='data', cartoes=None, data=None, max_concorrencia=MAX_CONCORRENCIA):
+    cartoes = carregar_cartoes() if cartoes is None else cartoes
+    data = data or datetime.now().strftime('%Y-%m-%d')
+    os.makedirs(data_dir, exist_ok=True)
+    estado = carregar_estado(_estado_path(data_dir))
+    trava = threading.Lock()
+    resultados = {}
+
+    def extrair(sessao, cartao):
+        destino = os.path.join(data_dir, f'{cartao.prefixo}-{data}.csv')
+        try:
+            novo_estado, alterado = baixar_cartao(sessao, base_url, cartao, destino, estado.get(cartao.prefixo, {}))
+        except Exception as e:
+            print(f"Erro ao obter o card {cartao.card_id} ({cartao.prefixo}) do Metabase: {e}")
+            return
+        with trava:
+            estado[cartao.prefixo] = novo_estado
+            resultados[cartao.prefixo] = (destino, alterado)
+
+    with criar_sessao(max_concorrencia) as sessao, ThreadPoolExecutor(max_workers=max_concorrencia) as executor:
+        list(executor.map(lambda cartao: extrair(sessao, cartao), cartoes))
+    salvar_estado(_estado_path(data_dir), estado)
+    return resultados
@@ -1,45 +1,34 @@
-from datetime import datetime
-import requests
-import pandas as pd
 import duckdb
 import os
+import shutil
 
 from dotenv import load_dotenv
 load_dotenv()
 
-METABASE_URL = 'https://novopnp-mb.mec.gov.br'
+from archive import arquivar_pendentes, arquivar_snapshot
+from database import DB_PATH
+from extracao import extrair_cartoes
+from ingest import carregar_pendentes, criar_tabelas
+from relatorios import gerar_relatorios
+from rollups import atualizar_agregados
+from tendencias import atualizar_tendencias
 
-def __get_data_from_metabase():
-    try:
-        headers = {
-            'Content-Type': 'application/json',
-            'x-api-key': os.environ.get('METABASE_API_KEY')
-        }
-        response = requests.post(f"{METABASE_URL}/api/card/71/query/csv", headers=headers)
-        if response.status_code == 200:
-            hoje = datetime.now().strftime('%Y-%m-%d')
-            with open(f'data/dados-{hoje}.csv', 'wb') as f:
-                f.write(response.content)
-        else:
-            print(f"Erro ao obter os dados do Metabase: {response.text}")
+METABASE_URL = os.environ.get('METABASE_URL', 'https://novopnp-mb.mec.gov.br')
 
-    except Exception as e:
-        print(f"Erro ao conectar ao Metabase: {e}")
+# Gera os relatórios estáticos por Instituição depois de publicar o banco (PNP_RELATORIOS_APOS_CARGA=0 desativa)
+RELATORIOS_APOS_CARGA = os.environ.get('PNP_RELATORIOS_APOS_CARGA', '1') == '1'
 
-def __get_data_from_csv():
+def __get_data_from_metabase(base_url=None):
     try:
-        hoje = datetime.now().strftime('%Y-%m-%d')
-
-        df = pd.read_csv(f'data/dados-{hoje}.csv')
-        df.columns = ['Instituição', 'Unidade', 'Escopo da Inconsistência', 'Situação da Inconsistência', 'Total de Inconsistências']
-        df.to_csv(f'data/dados-{hoje}.csv', index=False)
-
-        return df
-
+        # Baixa em paralelo todos os cards configurados em PNP_CARTOES
+        resultados = extrair_cartoes(base_url or METABASE_URL)
+        alterados = [prefixo for prefixo, (_, alterado) in resultados.items() if alterado]
+        print(f"{len(resultados)} card(s) obtido(s) do Metabase, {len(alterados)} com alterações.")
+        return resultados
     except Exception as e:
-        print(f"Erro ao ler o arquivo CSV: {e}")
+        print(f"Erro ao conectar ao Metabase: {e}")
 
-def __create_duckdb_connection(db_path='db.duckdb'):
+def __create_duckdb_connection(db_path=DB_PATH):
     try:
         conn = duckdb.connect(database=db_path)
         return conn
@@ -49,47 +38,122 @@ def __create_duckdb_connection(db_path='db.duckdb'):
 
 def __create_table_in_duckdb(conn):
     try:
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS pnp_data (
-            "Instituição" VARCHAR,
-            "Unidade" VARCHAR,
-            "Escopo da Inconsistência" VARCHAR,
-            "Situação da Inconsistência" VARCHAR,
-            "Total de Inconsistências" INTEGER,
-            "Data do Processamento" DATE
-        )
-        """)
+        criar_tabelas(conn)
     except Exception as e:
         print(f"Erro ao criar a tabela: {e}")
 
-def __insert_data_if_needed(conn, csv_path='dados.csv'):
-    try:
-        last_processing_date = conn.execute("SELECT MAX(\"Data do Processamento\") FROM pnp_data").fetchdf().values[0][0]
+# Function to prepare the staging copy of the database, where the new snapshots are loaded.
+# The dashboard keeps reading the published file, so the load never holds its lock.
+def __create_staging_database(db_path=DB_PATH):
+    staging_path = f'{db_path}.staging'
+    for caminho in (staging_path, f'{staging_path}.wal'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    if os.path.exists(db_path):
+        shutil.copy2(db_path, staging_path)
+        if os.path.exists(f'{db_path}.wal'):
+            shutil.copy2(f'{db_path}.wal', f'{staging_path}.wal')
+    return staging_path
+
+# Function to publish the staging database with an atomic rename. Running dashboards detect
+# the new file (its inode changes) on their next query, reopen their connection and drop
+# their cached results; queries already running finish on the old file.
+def __swap_database(staging_path, db_path=DB_PATH):
+    os.replace(staging_path, db_path)
+    if os.path.exists(f'{db_path}.wal'):
+        os.remove(f'{db_path}.wal')
+    print(f"Banco de dados publicado em {db_path}.")
 
-        if last_processing_date != pd.to_datetime('today').date():
-            conn.execute(f"""
-            INSERT INTO pnp_data
-                SELECT *, current_date as "Data do Processamento" FROM read_csv('{csv_path}');
-            """)
+def __ingest_pending_snapshots(conn):
+    try:
+        # Carrega cada arquivo data/dados-*.csv ainda não carregado (ou alterado),
+        # usando a data do nome do arquivo como data do processamento
+        datas = carregar_pendentes(conn)
+        print(f"{len(datas)} snapshot(s) carregado(s).")
+        return datas
     except Exception as e:
         print(f"Erro ao inserir dados: {e}")
+        return []
+
+def __update_rollups(conn):
+    try:
+        datas = atualizar_agregados(conn)
+        print(f"Agregados atualizados para {len(datas)} data(s) de processamento.")
+    except Exception as e:
+        print(f"Erro ao atualizar as tabelas agregadas: {e}")
+
+def __update_trends(conn):
+    try:
+        inicio = atualizar_tendencias(conn)
+        if inicio is not None:
+            print(f"Tendências atualizadas a partir de {inicio}.")
+    except Exception as e:
+        print(f"Erro ao atualizar as tendências: {e}")
+
+def __archive_snapshots(conn, datas_carregadas):
+    try:
+        # Snapshots recarregados nesta execução são arquivados novamente
+        for data in datas_carregadas:
+            arquivar_snapshot(conn, data)
+        datas = datas_carregadas + arquivar_pendentes(conn)
+        print(f"{len(datas)} snapshot(s) arquivado(s) em Parquet.")
+    except Exception as e:
+        print(f"Erro ao arquivar os snapshots: {e}")
+
+def __generate_reports():
+    try:
+        # Somente as Instituições com dados alterados têm o relatório refeito
+        gerados = gerar_relatorios()
+        print(f"{len(gerados)} relatório(s) estático(s) gerado(s).")
+    except Exception as e:
+        print(f"Erro ao gerar os relatórios: {e}")
+
+# Function to apply a maintenance operation, operacao(conn), to a staging copy of the database
+# and publish it with the same atomic swap as the pipeline. If the operation fails, nothing is
+# published and the error is raised to the caller.
+def run_maintenance(operacao):
+    staging_path = __create_staging_database()
+    conn = duckdb.connect(database=staging_path)
+    try:
+        criar_tabelas(conn)
+        resultado = operacao(conn)
+        conn.execute("CHECKPOINT")
+    except Exception:
+        conn.close()
+        os.remove(staging_path)
+        raise
+    conn.close()
+    __swap_database(staging_path)
+    return resultado
 
 def run_pipeline():
+    conn = None
     try:
         # Get data from Metabase and save it to a CSV file
         __get_data_from_metabase()
-        __get_data_from_csv()
 
-        # Create a connection to the database
-        conn = __create_duckdb_connection()
+        # Create a connection to a staging copy of the database
+        staging_path = __create_staging_database()
+        conn = __create_duckdb_connection(staging_path)
         __create_table_in_duckdb(conn)
        
-        today = datetime.now().strftime("%Y-%m-%d")
-        __insert_data_if_needed(conn, f'data/dados-{today}.csv')
+        datas_carregadas = __ingest_pending_snapshots(conn)
+        __update_rollups(conn)
+        __update_trends(conn)
+        __archive_snapshots(conn, datas_carregadas)
+
+        # Grava tudo no arquivo (sem WAL pendente) antes de publicá-lo
+        conn.execute("CHECKPOINT")
+        conn.close()
+        conn = None
+        __swap_database(staging_path)
+        if RELATORIOS_APOS_CARGA:
+            __generate_reports()
     except Exception as e:
         print(f"Erro ao executar o pipeline: {e}")
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
 
 if __name__ == '__main__':
     run_pipeline()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import glob
+import hashlib
+import os
+import re
+from datetime import date
+
+from rollups import atualizar_data, atualizar_hierarquia, criar_tabelas_agregadas, migrar_agregados_legados
+from schema import (
+    criar_tabelas_dimensionais,
+    criar_view_pnp_data,
+    garantir_dimensoes,
+    inserir_fatos,
+    migrar_pnp_data_legado,
+)
+from tendencias import atualizar_tendencias_desde, criar_tabelas_tendencia
+from validacao import (
+    SnapshotInvalido,
+    colocar_em_quarentena,
+    criar_tabela_validacoes,
+    formatar_relatorio,
+    registrar_validacao,
+    validar_snapshot,
+)
+
+DATA_DIR = 'data'
+QUARENTENA_DIR = 'quarentena'
+PADRAO_ARQUIVO = re.compile(r'dados-(\d{4}-\d{2}-\d{2})\.csv$')
+
+# Function to create (or migrate to) the normalized schema: dimensions, fact table,
+# pnp_data view, rollups, filter metadata, trend tables, the validation log and the ingest ledger
+# (one row per loaded snapshot)
+def criar_tabelas(conn):
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        criar_tabelas_dimensionais(conn)
+        migrar_pnp_data_legado(conn)
+        migrar_agregados_legados(conn)
+        criar_view_pnp_data(conn)
+        criar_tabelas_agregadas(conn)
+        criar_tabelas_tendencia(conn)
+        criar_tabela_validacoes(conn)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS pnp_cargas (
+            "Data do Processamento" DATE PRIMARY KEY,
+            arquivo VARCHAR,
+            hash VARCHAR,
+            linhas BIGINT,
+            carregado_em TIMESTAMP
+        )
+        """)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+# Function to compute the content hash of a file without parsing it
+def hash_arquivo(caminho, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+# Function to extract the snapshot date from a dados-YYYY-MM-DD.csv file name
+def data_do_arquivo(caminho):
+    encontrado = PADRAO_ARQUIVO.search(os.path.basename(caminho))
+    if encontrado is None:
+        return None
+    return date.fromisoformat(encontrado.group(1))
+
+# Function to list the daily export files, ordered by snapshot date
+def listar_arquivos(data_dir=DATA_DIR):
+    arquivos = [(data_do_arquivo(caminho), caminho)
+                for caminho in glob.glob(os.path.join(data_dir, 'dados-*.csv'))]
+    return sorted((data, caminho) for data, caminho in arquivos if data is not None)
+
+# Function to validate and load one snapshot atomically: replaces the rows of its date,
+# refreshes the rollups of that date, the filter metadata and the trends from that date onwards,
+# and records the load in the ledger.
+# Returns the validation of the loaded snapshot, or None when the same content was already
+# loaded for that date. Raises SnapshotInvalido when the file fails the validation.
+def carregar_snapshot(conn, csv_path, data_processamento):
+    hash_atual = hash_arquivo(csv_path)
+    registrado = conn.execute(
+        'SELECT hash FROM pnp_cargas WHERE "Data do Processamento" = ?', [data_processamento]).fetchone()
+    if registrado is not None and registrado[0] == hash_atual:
+        return None
+
+    # Leitura única do arquivo: a validação deixa as linhas tipadas na tabela temporária "carga"
+    validacao = validar_snapshot(conn, csv_path, data_processamento, 'carga')
+    registrar_validacao(conn, validacao, hash_atual)
+    if not validacao.aprovada:
+        raise SnapshotInvalido(validacao)
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute('DELETE FROM pnp_fato WHERE "Data do Processamento" = ?', [data_processamento])
+        garantir_dimensoes(conn, 'carga')
+        inserir_fatos(conn, 'carga', data_processamento)
+        conn.execute("DROP TABLE carga")
+        linhas = conn.execute(
+            'SELECT COUNT(*) FROM pnp_fato WHERE "Data do Processamento" = ?', [data_processamento]).fetchone()[0]
+        atualizar_data(conn, data_processamento)
+        atualizar_hierarquia(conn)
+        atualizar_tendencias_desde(conn, data_processamento)
+        conn.execute("""
+        INSERT OR REPLACE INTO pnp_cargas VALUES (?, ?, ?, ?, current_timestamp)
+        """, [data_processamento, os.path.basename(csv_path), hash_atual, linhas])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return validacao
+
+# Function to load every export file whose snapshot is missing or changed in the ledger.
+# Files rejected by the validation are moved to data/quarentena; a compact report of the
+# validations is printed at the end.
+def carregar_pendentes(conn, data_dir=DATA_DIR):
+    criar_tabelas(conn)
+    carregadas = []
+    validacoes = []
+    for data_processamento, caminho in listar_arquivos(data_dir):
+        try:
+            validacao = carregar_snapshot(conn, caminho, data_processamento)
+            if validacao is not None:
+                carregadas.append(data_processamento)
+                validacoes.append(validacao)
+        except SnapshotInvalido as e:
+            validacoes.append(e.validacao)
+            destino = colocar_em_quarentena(e.validacao, os.path.join(data_dir, QUARENTENA_DIR))
+            print(f"Arquivo {caminho} movido para {destino}.")
+        except Exception as e:
+            print(f"Erro ao carregar o arquivo {caminho}: {e}")
+    if validacoes:
+        print(formatar_relatorio(validacoes))
+    return carregadas
+
+if __name__ == '__main__':
+    from worker import executar_manutencao
+
+    datas = executar_manutencao(carregar_pendentes)
+    print(f"{len(datas)} snapshot(s) carregado(s).")
@@ -0,0 +1,134 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# Instrumentação opcional das etapas do dashboard (PNP_INSTRUMENTACAO=1 ou ?debug=1 na URL).
+# Cada etapa gera uma linha de log JSON com duração, variação de memória residente e
+# contagens informadas pela própria etapa (linhas, pontos...). Desativada, custa uma
+# consulta a uma variável por etapa.
+INSTRUMENTACAO = os.environ.get('PNP_INSTRUMENTACAO', '0') == '1'
+PERFIL_DIR = os.environ.get('PNP_PERFIL_DIR', tempfile.gettempdir())
+
+logger = logging.getLogger('pnp.instrumentacao')
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Execução (rerun) corrente de cada sessão; o Streamlit executa cada sessão em sua própria thread
+_local = threading.local()
+
+# Function to read the resident memory of the process, in bytes (None where /proc is unavailable)
+def memoria_residente():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+# Function to count the rows of a query result (a frame or a dict of frames)
+def contar_linhas(valor):
+    if valor is None:
+        return 0
+    if isinstance(valor, dict):
+        return sum(contar_linhas(item) for item in valor.values())
+    return len(valor)
+
+def _log(evento, **campos):
+    logger.info(json.dumps({'evento': evento, **campos}, ensure_ascii=False, default=str))
+
+# Medições de uma execução da página
+class Execucao:
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:8]
+        self.etapas = []
+        self._inicio = time.perf_counter()
+        self._memoria_inicial = memoria_residente()
+
+    def registrar(self, registro):
+        self.etapas.append(registro)
+        _log('etapa', execucao=self.id, **registro)
+
+    def encerrar(self):
+        memoria_final = memoria_residente()
+        resumo = {
+            'duracao_ms': round((time.perf_counter() - self._inicio) * 1000, 1),
+            'etapas': len(self.etapas),
+            'memoria_residente_mb': round(memoria_final / 2 ** 20, 1) if memoria_final is not None else None,
+        }
+        _log('execucao', execucao=self.id, **resumo)
+        return resumo
+
+# Function to start the measurements of a page run (returns None when instrumentation is off)
+def iniciar_execucao(ativa=INSTRUMENTACAO):
+    _local.execucao = Execucao() if ativa else None
+    return _local.execucao
+
+# Function to get the measurements of the current page run
+def execucao_atual():
+    return getattr(_local, 'execucao', None)
+
+# Function to finish the measurements of a page run
+def encerrar_execucao(execucao):
+    _local.execucao = None
+    if execucao is None:
+        return None
+    return execucao.encerrar()
+
+# Context manager that times one stage of the current run. The yielded dict
+# receives the stage's own counters (e.g. registro['linhas'] = len(df)).
+@contextmanager
+def etapa(nome, **atributos):
+    execucao = execucao_atual()
+    if execucao is None:
+        yield atributos
+        return
+
+    memoria_inicial = memoria_residente()
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    finally:
+        memoria_final = memoria_residente()
+        delta = (memoria_final - memoria_inicial) / 2 ** 20 if memoria_inicial is not None and memoria_final is not None else None
+        execucao.registrar({
+            'etapa': nome,
+            'duracao_ms': round((time.perf_counter() - inicio) * 1000, 1),
+            'memoria_delta_mb': round(delta, 2) if delta is not None else None,
+            **atributos,
+        })
+
+# Function to start a cProfile capture (None if another profiler is already running)
+def iniciar_perfil():
+    perfilador = cProfile.Profile()
+    try:
+        perfilador.enable()
+    except ValueError as e:
+        _log('perfil_indisponivel', erro=str(e))
+        return None
+    return perfilador
+
+# Function to stop a cProfile capture, save it as a .prof file (readable with pstats/snakeviz)
+# and return the file path with the top functions by cumulative time
+def encerrar_perfil(perfilador, limite=30, perfil_dir=PERFIL_DIR):
+    perfilador.disable()
+    os.makedirs(perfil_dir, exist_ok=True)
+    caminho = os.path.join(perfil_dir, f"perfil-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+    perfilador.dump_stats(caminho)
+
+    texto = io.StringIO()
+    pstats.Stats(perfilador, stream=texto).sort_stats('cumulative').print_stats(limite)
+    _log('perfil', arquivo=caminho)
+    return caminho, texto.getvalue()
@@ -1,39 +1,134 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import duckdb
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import timedelta
 
-# Function to create a connection to the database
-def create_connection(db_path='db.duckdb'):
+from database import conexao_compartilhada, cache_resultados
+from instrumentacao import (
+    INSTRUMENTACAO,
+    contar_linhas,
+    encerrar_execucao,
+    encerrar_perfil,
+    etapa,
+    iniciar_execucao,
+    iniciar_perfil,
+)
+from tendencias import DIAS_PARADA
+from exportacao import FORMATOS, gerar_arquivo, nome_arquivo
+from reducao import (
+    LINHAS_POR_PAGINA_TABELA,
+    MAX_PONTOS_LINHA_DO_TEMPO,
+    TOP_N_PROGRESSO,
+    ajustar_payload,
+    contar_entidades,
+    limitar_payload,
+    reduzir_linha_do_tempo,
+    selecionar_pagina,
+    total_paginas,
+)
+from queries import (
+    criar_filtros,
+    consultar_versao,
+    consultar_opcoes,
+    consultar_detalhe,
+    consultar_linha_do_tempo,
+    consultar_progresso,
+    consultar_resumo,
+    consultar_tendencias,
+    IndiceHierarquia,
+    indexar_detalhe,
+    indexar_hierarquia,
+    selecionar_detalhe,
+    unidades_de,
+)
+
+# Dict com as cores a serem usadas para cada tipo de inconsistência
+CORES_POR_TIPO = {
+    'Inconsistente RA': '#F5A5A0',  # Vermelho suave para inconsistente
+    'Alterado RA': '#FFDD66',  # Amarelo suave para alterado
+    'Validado RA': '#A8D08D',  # Verde claro suave para validado
+    'Inconsistente PI': '#F5A5A0',  # Vermelho suave e claro para inconsistente PI
+    'Alterado PI': '#FFD34E',  # Amarelo suave e mais escuro para alterado PI
+    'Validado PI': '#66B88C',  # Verde suave e mais escuro para validado PI
+    'Alterado RE': '#F5C256',  # Amarelo mais escuro para alterado RE
+    'Validado RE': '#4C8C43'  # Verde escuro mais equilibrado para validado RE
+}
+
+# Escopos com uma visão própria no painel
+ESCOPOS = ['Curso', 'Ciclo', 'Matrícula']
+
+# Function to get a cursor on the shared read-only connection to the database
+def create_connection():
     try:
-        conn = duckdb.connect(database=db_path)
+        conn = conexao_compartilhada.cursor()
         return conn
     except Exception as e:
         st.error(f"Erro ao conectar ao banco de dados: {e}")
         return None
 
-# Function to query the data for the last processing date
-def query_data(conn):
+# Function to query the version of the loaded data, used to invalidate the result cache.
+# Includes the signature of the database file, so a published load that replaces a
+# snapshot of the same date also invalidates it.
+def query_version(conn):
     try:
-        df = conn.execute("""
-            SELECT * FROM pnp_data
-        """).fetchdf()
-        return df
+        return (consultar_versao(conn), conexao_compartilhada.assinatura)
     except Exception as e:
         st.error(f"Erro ao consultar dados: {e}")
-        return pd.DataFrame()
+        return None
+
+# Function to query the date bounds and the hierarchy index for the sidebar filters
+def query_options(conn, versao=None):
+    def consultar():
+        min_date, max_date, hierarquia = consultar_opcoes(conn)
+        return min_date, max_date, indexar_hierarquia(hierarquia)
+
+    try:
+        return cache_resultados.obter(('opcoes',), versao, consultar)
+    except Exception as e:
+        st.error(f"Erro ao consultar dados: {e}")
+        return None, None, IndiceHierarquia({}, ())
+
+# Function to load the whole detail history once per data version, indexed by
+# (date, Instituição, Unidade), so that selection changes only slice it
+def query_detail_index(conn, versao=None):
+    return cache_resultados.obter(('detalhe_indexado',), versao,
+                                  lambda: indexar_detalhe(consultar_detalhe(conn, criar_filtros())))
+
+# Function to query only the aggregates each chart needs for the selected filters
+# (results are shared between sessions through the cache, keyed by filters and data version)
+def query_data(conn, filtros, incluir_unidades=False, versao=None):
+    def consultar():
+        dados = {
+            'detalhe': selecionar_detalhe(query_detail_index(conn, versao), filtros),
+            'linha_do_tempo': consultar_linha_do_tempo(conn, filtros),
+            'progresso_instituicao': consultar_progresso(conn, filtros, 'Instituição'),
+            'resumo': consultar_resumo(conn, filtros),
+        }
+        if incluir_unidades:
+            dados['progresso_unidade'] = consultar_progresso(conn, filtros, 'Unidade')
+        return dados
+
+    try:
+        return cache_resultados.obter(('dados', filtros, incluir_unidades), versao, consultar)
+    except Exception as e:
+        st.error(f"Erro ao consultar dados: {e}")
+        return None
+
+# Function to query the precomputed trend metrics per Instituição or Unidade
+def query_trends(conn, filtros, entity_type, versao=None):
+    try:
+        return cache_resultados.obter(('tendencias', filtros, entity_type), versao,
+                                      lambda: consultar_tendencias(conn, filtros, entity_type))
+    except Exception as e:
+        st.error(f"Erro ao consultar dados: {e}")
+        return None
 
 # Function to process the data
 def process_data(df):
     try:
-        df_grouped = df.groupby(['Data do Processamento', 'Instituição', 'Unidade', 'Escopo da Inconsistência', 'Situação da Inconsistência'], as_index=False)['Total de Inconsistências'].sum()
+        df_grouped = df.copy()
         df_grouped['Data do Processamento'] = pd.to_datetime(df_grouped['Data do Processamento'])
-        # Mantém o formato de data para o filtro, mas preserva o objeto datetime para o gráfico de linha do tempo
-        df_grouped['Data Formatada'] = df_grouped['Data do Processamento'].dt.strftime('%d/%m/%Y')
-        
         return df_grouped
     except Exception as e:
         st.error(f"Erro ao processar dados: {e}")
@@ -46,25 +141,26 @@ def close_connection(conn):
     except Exception as e:
         st.error(f"Erro ao fechar a conexão: {e}")
 
-# Function to create timeline chart
-def create_timeline_chart(data, cores_por_tipo, escopo_filter=None, instituicao_filter=None, unidade_filter=None):
+# Function to create timeline chart (aggregated by week/month above max_pontos dates)
+def create_timeline_chart(data, cores_por_tipo, escopo_filter=None, instituicao_filter=None, unidade_filter=None,
+                          max_pontos=MAX_PONTOS_LINHA_DO_TEMPO):
     if data.empty:
         return go.Figure()
     
-    # Filtrar dados conforme necessário
-    filtered_data = data.copy()
+    # Os dados já chegam filtrados por instituição/unidade pela consulta;
+    # aqui resta apenas o recorte por escopo
+    filtered_data = data
     if escopo_filter:
         filtered_data = filtered_data[filtered_data['Escopo da Inconsistência'] == escopo_filter]
-    if instituicao_filter and instituicao_filter != 'Todos':
-        filtered_data = filtered_data[filtered_data['Instituição'] == instituicao_filter]
-    if unidade_filter and unidade_filter != 'Todos':
-        filtered_data = filtered_data[filtered_data['Unidade'] == unidade_filter]
         
     if filtered_data.empty:
         return go.Figure()
     
     # Agrupar por data e situação
-    timeline_df = filtered_data.groupby(['Data do Processamento', 'Situação da Inconsistência'], as_index=False)['Total de Inconsistências'].sum()
+    timeline_df = filtered_data.groupby(['Data do Processamento', 'Situação da Inconsistência'], as_index=False, observed=True)['Total de Inconsistências'].sum()
+    
+    # Períodos longos são reduzidos ao último processamento de cada semana/mês
+    timeline_df, granularidade = reduzir_linha_do_tempo(timeline_df, max_pontos)
     
     # Se houver apenas uma data, criar um ponto adicional para mostrar tendência
     dates = timeline_df['Data do Processamento'].unique()
@@ -99,10 +195,14 @@ def create_timeline_chart(data, cores_por_tipo, escopo_filter=None, instituicao_
     if unidade_filter and unidade_filter != 'Todos':
         title += f" - {unidade_filter}"
     
+    xaxis_title = "Data do Processamento"
+    if granularidade != 'diária':
+        xaxis_title += f" (visão {granularidade}: último processamento de cada período)"
+    
     # Configurações do layout
     fig.update_layout(
         title=title,
-        xaxis_title="Data do Processamento",
+        xaxis_title=xaxis_title,
         yaxis_title="Total de Inconsistências",
         legend=dict(
             orientation="h",
@@ -120,8 +220,8 @@ def create_timeline_chart(data, cores_por_tipo, escopo_filter=None, instituicao_
     
     return fig
 
-# Function to create progress chart
-def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None):
+# Function to create progress chart (one page of top_n entities plus an "Outros" bar)
+def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None, top_n=TOP_N_PROGRESSO, pagina=1):
     if data.empty:
         return go.Figure()
     
@@ -140,7 +240,8 @@ def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None)
         index=[entity_type],
         columns='Situação da Inconsistência',
         values='Total de Inconsistências',
-        aggfunc='sum'
+        aggfunc='sum',
+        observed=True
     ).fillna(0).reset_index()
     
     # Garante que todas as colunas existam
@@ -150,13 +251,19 @@ def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None)
             
     # Calcula o total e o percentual de cada situação
     pivot_df['Total'] = pivot_df[[col for col in list(cores_por_tipo.keys())]].sum(axis=1)
-    for tipo in cores_por_tipo.keys():
-        pivot_df['% ' + tipo] = (pivot_df[tipo]/pivot_df['Total'] * 100).round(1)
     
+    # Mantém apenas a página selecionada; as demais entidades são somadas em "Outros"
+    pivot_df, outros_df = selecionar_pagina(pivot_df, entity_type, list(cores_por_tipo.keys()) + ['Total'], top_n, pagina)
    
     # Ordena por total (maior para o menor)
     #pivot_df = pivot_df.sort_values('Total', ascending=False)
-    pivot_df = pivot_df.sort_values('Instituição',ascending=False) #Ajustado para ordem alfabética.
+    pivot_df = pivot_df.sort_values(entity_type,ascending=False) #Ajustado para ordem alfabética.
+    if outros_df is not None:
+        # A barra "Outros" fica no final (primeira linha = base do gráfico)
+        pivot_df = pd.concat([outros_df, pivot_df.astype({entity_type: str})], ignore_index=True)
+    for tipo in cores_por_tipo.keys():
+        pivot_df['% ' + tipo] = (pivot_df[tipo]/pivot_df['Total'] * 100).round(1)
+    
     # Cria gráfico de barras horizontais empilhadas
     fig = go.Figure()
     
@@ -178,6 +285,8 @@ def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None)
     title = f"Progresso por {entity_type}"
     if escopo_filter:
         title += f" - Escopo: {escopo_filter}"
+    if outros_df is not None:
+        title += f" - Página {pagina}"
     
     # Configurações do layout
     fig.update_layout(
@@ -198,89 +307,261 @@ def create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter=None)
     
     return fig
 
-# Function to create summary cards
-def create_summary_cards(data, tipos_inconsistencia, escopo_filter=None):
+# Function to compute, in a single pass, the summary of every (escopo, situação) pair.
+# Returns a frame indexed by (escopo, situação), including the 'Todos' escopo and the
+# 'Total' situação, with the latest and previous totals and the percent change
+# (NaN when there is no previous snapshot or its total is zero).
+def calcular_resumo(data, tipos_inconsistencia):
+    colunas = {'ultimo': 'int64', 'penultimo': 'float64', 'evolucao_pct': 'float64'}
     if data.empty:
-        return
-    
-    # Filtra por escopo se especificado
-    if escopo_filter:
-        data = data[data['Escopo da Inconsistência'] == escopo_filter]
-        
-    if data.empty:
-        return
-    
+        return pd.DataFrame({coluna: pd.Series(dtype=tipo) for coluna, tipo in colunas.items()})
 
-    dados_ultimo_processamento = data[data['Data do Processamento'] == data['Data do Processamento'].max()]
-    dados_penultimo_processamento = data[data['Data do Processamento'] == data['Data do Processamento'].unique()[-2]]
+    datas = np.sort(data['Data do Processamento'].unique())
+    ultima = datas[-1]
+    penultima = datas[-2] if len(datas) > 1 else None
 
-    # Cálculo de totais por tipo de inconsistência no último processamento
-    totais_ultimo_processamento = dados_ultimo_processamento.groupby('Situação da Inconsistência')['Total de Inconsistências'].sum()
-    # Garantir que todos os tipos de inconsistencia estejam presentes
-    for tipo in tipos_inconsistencia:
-        if tipo not in totais_ultimo_processamento.index:
-            totais_ultimo_processamento[tipo] = 0
+    # Totais por (escopo, situação, data) e por (situação, data) para o escopo 'Todos'
+    por_escopo = data.groupby(['Escopo da Inconsistência', 'Situação da Inconsistência', 'Data do Processamento'],
+                              observed=True)['Total de Inconsistências'].sum()
+    por_escopo.index = por_escopo.index.set_levels(por_escopo.index.levels[0].astype(str), level=0)
+    geral = data.groupby(['Situação da Inconsistência', 'Data do Processamento'],
+                         observed=True)['Total de Inconsistências'].sum()
+    geral = pd.concat({'Todos': geral}, names=['Escopo da Inconsistência'])
+    totais = pd.concat([por_escopo, geral]).unstack('Data do Processamento')
 
-    # Cálculo de totais por tipo de inconsistência no penúltimo processamento
-    totais_penultimo_processamento = dados_penultimo_processamento.groupby('Situação da Inconsistência')['Total de Inconsistências'].sum()
-    # Garantir que todos os tipos de inconsistencia estejam presentes
-    for tipo in tipos_inconsistencia:
-        if tipo not in totais_penultimo_processamento.index:
-            totais_penultimo_processamento[tipo] = 0
+    escopos = ['Todos'] + sorted(por_escopo.index.get_level_values(0).unique())
+    situacoes = list(tipos_inconsistencia) + sorted(set(geral.index.get_level_values(1).astype(str)) - set(tipos_inconsistencia))
+    totais = totais.reindex(pd.MultiIndex.from_product(
+        [escopos, situacoes], names=totais.index.names))
 
-    # Cálculo de percentuais
-    evolucao_pct = (totais_ultimo_processamento - totais_penultimo_processamento) / totais_penultimo_processamento * 100
-    # Replace infinity values with a string flag
-    evolucao_pct.fillna('nan', inplace=True)
-    evolucao_pct.replace(np.inf, 'nan', inplace=True)
-    evolucao_pct.replace(-np.inf, 'nan', inplace=True)
-    
+    resumo = pd.DataFrame(index=totais.index)
+    resumo['ultimo'] = totais[ultima].fillna(0).astype('int64')
+    resumo['penultimo'] = totais[penultima].fillna(0) if penultima is not None else np.nan
+
+    # Linha 'Total' de cada escopo
+    total = resumo.groupby(level=0, sort=False).sum(min_count=1)
+    total.index = pd.MultiIndex.from_arrays([total.index, ['Total'] * len(total)], names=resumo.index.names)
+    resumo = pd.concat([resumo, total]).sort_index(level=0, sort_remaining=False)
+
+    penultimo = resumo['penultimo'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resumo['evolucao_pct'] = np.where(penultimo > 0, (resumo['ultimo'] - penultimo) / penultimo * 100, np.nan)
+    return resumo.astype(colunas)
+
+# Function to create summary cards
+def create_summary_cards(resumo, tipos_inconsistencia, escopo_filter=None):
+    escopo = escopo_filter or 'Todos'
+    if resumo.empty or escopo not in resumo.index.get_level_values(0):
+        return
+
+    resumo_escopo = resumo.loc[escopo]
 
-    
     # Linha 1: Total
     titulo = "Total de Inconsistências"
     if escopo_filter:
         titulo += f" ({escopo_filter})"
     _, col_total, _ = st.columns(3)
     with col_total:
-        st.metric(titulo, f"{totais_ultimo_processamento.sum():,}".replace(",", "."))
+        st.metric(titulo, f"{resumo_escopo.loc['Total', 'ultimo']:,}".replace(",", "."))
       
     # Linha 2: Totais dos primeiros 4 tipo2
     row1col1, row1col2, row1col3, row1col4 = st.columns(4)
     row1_delta_color = ['inverse', 'normal', 'normal', 'normal']
     for tipo, cell, delta_color in zip(tipos_inconsistencia[:4], [row1col1, row1col2, row1col3, row1col4], row1_delta_color):
-        display_metric(tipo, totais_ultimo_processamento, evolucao_pct, cell, delta_color)
+        display_metric(tipo, resumo_escopo, cell, delta_color)
     
     #Linha 3: Totais dos últimos 4 tipos
     row2col1, row2col2, row2col3, row2col4 = st.columns(4)
     row2_delta_color = ['normal', 'normal', 'normal', 'normal']
     for tipo, cell, delta_color in zip(tipos_inconsistencia[4:], [row2col1, row2col2, row2col3, row2col4], row2_delta_color):
-        display_metric(tipo, totais_ultimo_processamento, evolucao_pct, cell, delta_color)
+        display_metric(tipo, resumo_escopo, cell, delta_color)
+
+# Função para formatar o valor e a evolução de um card (também usada nos relatórios estáticos)
+def formatar_metrica(tipo, resumo_escopo):
+    evolucao_pct = resumo_escopo.loc[tipo, 'evolucao_pct']
+    valor = f"{resumo_escopo.loc[tipo, 'ultimo']:,}".replace(",", ".")
+    return valor, f"{evolucao_pct:.1f}%" if not np.isnan(evolucao_pct) else '-'
 
 # Função para exibir cada card
-def display_metric(tipo, totais_ultimo_processamento, evolucao_pct, cell, delta_color):
+def display_metric(tipo, resumo_escopo, cell, delta_color):
+    valor, evolucao = formatar_metrica(tipo, resumo_escopo)
     with cell:
-        st.metric(tipo, f"{totais_ultimo_processamento.loc[tipo]:,}".replace(",", "."), 
-                  f"{evolucao_pct.loc[tipo]:.1f}%" if evolucao_pct.loc[tipo] != 'nan' else '-', 
-                  delta_color=delta_color if evolucao_pct.loc[tipo] != 'nan' else 'off')    
+        st.metric(tipo, valor, evolucao, delta_color=delta_color if evolucao != '-' else 'off')
 
 
-# Main function
-def main():
-    conn = create_connection()
-    if conn is None:
+# Function to build a chart only once per filter state and data version
+def cached_figure(chave, filtros, versao, construir):
+    return cache_resultados.obter(('figura', filtros) + chave, versao, construir)
+
+# Function to get a timeline chart from the cache, kept within the payload limit
+def timeline_figure(data, cores_por_tipo, filtros, versao, escopo_filter=None, instituicao_filter=None, unidade_filter=None):
+    def construir():
+        with etapa('create_timeline_chart', escopo=escopo_filter, linhas=len(data)):
+            return limitar_payload(
+                lambda n: create_timeline_chart(data, cores_por_tipo, escopo_filter, instituicao_filter, unidade_filter, max_pontos=n),
+                MAX_PONTOS_LINHA_DO_TEMPO)
+
+    chave = ('linha_do_tempo', escopo_filter, unidade_filter)
+    return cached_figure(chave, filtros, versao, construir)
+
+# Function to get the number of bars per page of a progress chart: TOP_N_PROGRESSO, halved
+# while the first page exceeds the payload limit. Every page uses this size, so the pages
+# cover all the entities.
+def progress_page_size(data, entity_type, cores_por_tipo, filtros, versao, escopo_filter=None):
+    def calcular():
+        with etapa('create_progress_chart', entidade=entity_type, escopo=escopo_filter, linhas=len(data)):
+            return ajustar_payload(
+                lambda n: create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter, top_n=n),
+                TOP_N_PROGRESSO)[1]
+
+    return cached_figure((entity_type, escopo_filter, 'por_pagina'), filtros, versao, calcular)
+
+# Function to get one page of a progress chart from the cache
+def progress_figure(data, entity_type, cores_por_tipo, filtros, versao, escopo_filter=None, pagina=1,
+                    top_n=TOP_N_PROGRESSO):
+    def construir():
+        with etapa('create_progress_chart', entidade=entity_type, escopo=escopo_filter, linhas=len(data)):
+            return create_progress_chart(data, entity_type, cores_por_tipo, escopo_filter, top_n=top_n, pagina=pagina)
+
+    chave = (entity_type, escopo_filter, pagina, top_n)
+    return cached_figure(chave, filtros, versao, construir)
+
+# Function to show a timeline chart
+def render_timeline_chart(data, cores_por_tipo, filtros, versao, escopo_filter=None, instituicao_filter=None, unidade_filter=None):
+    fig = timeline_figure(data, cores_por_tipo, filtros, versao, escopo_filter, instituicao_filter, unidade_filter)
+    with etapa('st.plotly_chart', grafico='linha_do_tempo', escopo=escopo_filter):
+        st.plotly_chart(fig, width='stretch')
+
+# Function to show a progress chart, paginated when its entities do not fit in one page
+def render_progress_chart(data, entity_type, cores_por_tipo, filtros, versao, escopo_filter=None):
+    top_n = progress_page_size(data, entity_type, cores_por_tipo, filtros, versao, escopo_filter)
+    paginas = total_paginas(contar_entidades(data, entity_type, escopo_filter), top_n)
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input(f"Página ({entity_type}, {top_n} por página)", min_value=1, max_value=paginas,
+                                 value=1, step=1, key=f"pagina_{entity_type}_{escopo_filter}")
+    fig = progress_figure(data, entity_type, cores_por_tipo, filtros, versao, escopo_filter, pagina, top_n)
+    with etapa('st.plotly_chart', grafico=entity_type, escopo=escopo_filter):
+        st.plotly_chart(fig, width='stretch')
+
+# Function to render the download buttons of the filtered detail. Files are generated by
+# DuckDB only when a button is clicked, with every row of the filters (not only the page shown).
+def render_export_buttons(filtros, escopo=None):
+    colunas = st.columns(len(FORMATOS))
+    for coluna, formato in zip(colunas, FORMATOS):
+        with coluna:
+            st.download_button(
+                f"Baixar {formato}",
+                data=lambda formato=formato: gerar_arquivo(filtros, formato, escopo),
+                file_name=nome_arquivo(filtros, formato, escopo),
+                mime=FORMATOS[formato][1],
+                on_click='ignore',
+                key=f"exportar_{formato}_{escopo}",
+            )
+
+# Function to render one page of the detail table, with the export buttons for the whole data
+def render_detail_table(data, filtros, escopo=None):
+    render_export_buttons(filtros, escopo)
+    paginas = total_paginas(len(data), LINHAS_POR_PAGINA_TABELA)
+    pagina = 1
+    if paginas > 1:
+        linhas = f"{len(data):,}".replace(',', '.')
+        pagina = st.number_input(f"Página ({linhas} linhas, {LINHAS_POR_PAGINA_TABELA} por página)",
+                                 min_value=1, max_value=paginas, value=1, step=1, key=f"pagina_tabela_{escopo}")
+    inicio = (pagina - 1) * LINHAS_POR_PAGINA_TABELA
+    display_df = data.iloc[inicio:inicio + LINHAS_POR_PAGINA_TABELA].copy()
+    # Somente as linhas da página são formatadas
+    display_df['Data do Processamento'] = display_df['Data do Processamento'].dt.strftime('%d/%m/%Y')
+    st.dataframe(display_df, hide_index=True)
+
+# Function to render the "Visão Geral" view
+def render_overview(dados, resumo, filtered_data, filtros, cores_por_tipo, versao):
+    st.write("## Resumo Geral de Inconsistências")
+    with etapa('create_summary_cards'):
+        create_summary_cards(resumo, tipos_inconsistencia=list(cores_por_tipo.keys()))
+    
+    # Gráfico de linha do tempo para acompanhar a evolução
+    st.write("## Evolução das Inconsistências")
+    render_timeline_chart(dados['linha_do_tempo'], cores_por_tipo, filtros, versao)
+    
+    # Visualização gráfica do progresso por instituição
+    st.write("## Progresso por Instituição")
+    render_progress_chart(dados['progresso_instituicao'], 'Instituição', cores_por_tipo, filtros, versao)
+    
+    # Se apenas uma instituição estiver selecionada, mostrar progresso por unidade
+    if len(filtros.instituicoes) == 1:
+        st.write("## Progresso por Unidade")
+        render_progress_chart(dados['progresso_unidade'], 'Unidade', cores_por_tipo, filtros, versao)
+    
+    # Mostrar tabela detalhada
+    with st.expander("Dados Detalhados"):
+        render_detail_table(filtered_data, filtros)
+
+# Function to render the view of a single escopo
+def render_scope(escopo, dados, resumo, filtered_data, filtros, cores_por_tipo, versao):
+    st.write(f"## Resumo de Inconsistências - {escopo}")
+    escopo_data = filtered_data[filtered_data['Escopo da Inconsistência'] == escopo]
+    
+    if escopo_data.empty:
+        st.info(f"Não há dados para o escopo {escopo} com os filtros selecionados.")
         return
+        
+    with etapa('create_summary_cards', escopo=escopo):
+        create_summary_cards(resumo, list(cores_por_tipo.keys()), escopo)
+    
+    # Gráfico de linha do tempo específico para este escopo
+    st.write(f"## Evolução das Inconsistências - {escopo}")
+    render_timeline_chart(dados['linha_do_tempo'], cores_por_tipo, filtros, versao, escopo)
+    
+    # Visualização gráfica do progresso por instituição para este escopo
+    st.write(f"## Progresso por Instituição - {escopo}")
+    render_progress_chart(dados['progresso_instituicao'], 'Instituição', cores_por_tipo, filtros, versao, escopo)
+    
+    # Se apenas uma instituição estiver selecionada, mostrar progresso por unidade para este escopo
+    if len(filtros.instituicoes) == 1:
+        st.write(f"## Progresso por Unidade - {escopo}")
+        render_progress_chart(dados['progresso_unidade'], 'Unidade', cores_por_tipo, filtros, versao, escopo)
+        
+        # Se uma instituição e uma unidade estiverem selecionadas, mostrar gráfico de linha do tempo específico
+        if len(filtros.unidades) == 1:
+            st.write(f"## Evolução na {filtros.unidades[0]} - {escopo}")
+            render_timeline_chart(dados['linha_do_tempo'], cores_por_tipo, filtros, versao, escopo,
+                                  filtros.instituicoes[0], filtros.unidades[0])
+    
+    # Mostrar tabela detalhada para este escopo
+    with st.expander(f"Dados Detalhados - {escopo}"):
+        render_detail_table(escopo_data, filtros, escopo)
 
-    df = query_data(conn)
-    df_grouped = process_data(df)
-    close_connection(conn)
+# Function to get the default date range of the filters: the last month of data
+def periodo_padrao(min_date, max_date):
+    default_start = max_date - timedelta(days=30)
+    if default_start < min_date:
+        default_start = min_date
+    return default_start, max_date
 
+# Main function
+def main():
     # Streamlit interface
     st.set_page_config(
         page_title="PNP 2025 - Painel Acompanhamento",
         layout="wide"
     )
 
+    with etapa('conexao'):
+        conn = create_connection()
+    if conn is None:
+        return
+
+    with etapa('query_version'):
+        versao = query_version(conn)
+    with etapa('query_options') as registro:
+        min_date, max_date, hierarquia = query_options(conn, versao)
+        registro['linhas'] = len(hierarquia.unidades)
+    if min_date is None:
+        close_connection(conn)
+        st.warning("Não há dados disponíveis.")
+        return
+
     # Title and description
     st.image('logo.svg', width=300)
     st.title("Painel Acompanhamento")
@@ -290,18 +571,11 @@ def main():
     st.sidebar.title("Filtros")
 
     # Include "Todos" as an option for each filter
-    instituicoes = ['Todos'] + sorted(df['Instituição'].unique().tolist())
-    unidades = ['Todos'] + sorted(df['Unidade'].unique().tolist())
+    instituicoes = ['Todos'] + list(hierarquia.unidades_por_instituicao)
     #escopos = sorted(df['Escopo da Inconsistência'].unique().tolist())
-    escopos = ['Curso','Ciclo','Matrícula']
-    # Filter for the processing date range
-    min_date = pd.to_datetime(df['Data do Processamento']).min().date()
-    max_date = pd.to_datetime(df['Data do Processamento']).max().date()
+    escopos = ESCOPOS
     
-    # Por padrão, considere o último mês de dados
-    default_start = max_date - timedelta(days=30)
-    if default_start < min_date:
-        default_start = min_date
+    default_start = periodo_padrao(min_date, max_date)[0]
         
     col1, col2 = st.sidebar.columns(2)
     with col1:
@@ -313,114 +587,134 @@ def main():
 
     # Filter the units based on the selected institution
     if 'Todos' not in instituicoes_selecionadas and instituicoes_selecionadas:
-        unidades = ['Todos'] + sorted(df[df['Instituição'].isin(instituicoes_selecionadas)]['Unidade'].unique().tolist())
+        unidades = ['Todos'] + unidades_de(hierarquia, instituicoes_selecionadas)
     else:
-        unidades = ['Todos'] + sorted(df['Unidade'].unique().tolist())
+        unidades = ['Todos'] + unidades_de(hierarquia)
         
     unidades_selecionadas = st.sidebar.multiselect("Selecione a Unidade", unidades, default='Todos')
 
-    # Apply filters
-    if 'Todos' in instituicoes_selecionadas or not instituicoes_selecionadas:
-        instituicoes_selecionadas = df['Instituição'].unique().tolist()
-    if 'Todos' in unidades_selecionadas or not unidades_selecionadas:
-        unidades_selecionadas = df['Unidade'].unique().tolist()
+    # Filter data by institution, unit and date range inside DuckDB
+    filtros = criar_filtros(data_inicial, data_final, instituicoes_selecionadas, unidades_selecionadas)
+    unica_instituicao = len(filtros.instituicoes) == 1
+    with etapa('query_data') as registro:
+        dados = query_data(conn, filtros, incluir_unidades=unica_instituicao, versao=versao)
+        registro['linhas'] = contar_linhas(dados)
+    close_connection(conn)
+    if dados is None:
+        return
 
-    # Filter data by institution, unit and date range
-    filtered_data = df_grouped[
-        df_grouped['Instituição'].isin(instituicoes_selecionadas) &
-        df_grouped['Unidade'].isin(unidades_selecionadas) &
-        (df_grouped['Data do Processamento'] >= pd.Timestamp(data_inicial)) &
-        (df_grouped['Data do Processamento'] <= pd.Timestamp(data_final))
-    ]
+    with etapa('process_data', linhas=len(dados['detalhe'])):
+        filtered_data = process_data(dados['detalhe'])
     
     if filtered_data.empty:
         st.warning("Não há dados para a combinação de filtros selecionada.")
         return
     
-    # Dict com as cores a serem usadas para cada tipo de inconsistência
-    cores_por_tipo = {
-        'Inconsistente RA': '#F5A5A0',  # Vermelho suave para inconsistente
-        'Alterado RA': '#FFDD66',  # Amarelo suave para alterado
-        'Validado RA': '#A8D08D',  # Verde claro suave para validado
-        'Inconsistente PI': '#F5A5A0',  # Vermelho suave e claro para inconsistente PI
-        'Alterado PI': '#FFD34E',  # Amarelo suave e mais escuro para alterado PI
-        'Validado PI': '#66B88C',  # Verde suave e mais escuro para validado PI
-        'Alterado RE': '#F5C256',  # Amarelo mais escuro para alterado RE
-        'Validado RE': '#4C8C43'  # Verde escuro mais equilibrado para validado RE
-    }
-    
-    # Criar abas para diferentes escopos de inconsistência
-    tabs = st.tabs(["Visão Geral"] + escopos)
+    cores_por_tipo = CORES_POR_TIPO
     
-    # Tab Visão Geral
-    with tabs[0]:
-        st.write("## Resumo Geral de Inconsistências")
-        create_summary_cards(filtered_data, tipos_inconsistencia=list(cores_por_tipo.keys()))
-        
-        # Gráfico de linha do tempo para acompanhar a evolução
-        st.write("## Evolução das Inconsistências")
-        fig_timeline = create_timeline_chart(filtered_data, cores_por_tipo)
-        st.plotly_chart(fig_timeline, use_container_width=True)
-        
-        # Visualização gráfica do progresso por instituição
-        st.write("## Progresso por Instituição")
-        fig_instituicao = create_progress_chart(filtered_data, 'Instituição', cores_por_tipo)
-        st.plotly_chart(fig_instituicao, use_container_width=True)
-        
-        # Se apenas uma instituição estiver selecionada, mostrar progresso por unidade
-        if len(instituicoes_selecionadas) == 1:
-            st.write("## Progresso por Unidade")
-            fig_unidade = create_progress_chart(filtered_data, 'Unidade', cores_por_tipo)
-            st.plotly_chart(fig_unidade, use_container_width=True)
-        
-        # Mostrar tabela detalhada
-        with st.expander("Dados Detalhados"):
-            display_df = filtered_data.copy()
-            display_df['Data do Processamento'] = display_df['Data Formatada']
-            display_df = display_df.drop('Data Formatada', axis=1)
-            st.dataframe(display_df, hide_index=True)
-    
-    # Tab para cada escopo de inconsistência
-    for i, escopo in enumerate(escopos, 1):
-        with tabs[i]:
-            st.write(f"## Resumo de Inconsistências - {escopo}")
-            escopo_data = filtered_data[filtered_data['Escopo da Inconsistência'] == escopo]
-            
-            if escopo_data.empty:
-                st.info(f"Não há dados para o escopo {escopo} com os filtros selecionados.")
-                continue
-                
-            create_summary_cards(filtered_data, list(cores_por_tipo.keys()), escopo)
-            
-            # Gráfico de linha do tempo específico para este escopo
-            st.write(f"## Evolução das Inconsistências - {escopo}")
-            fig_timeline_escopo = create_timeline_chart(filtered_data, cores_por_tipo, escopo)
-            st.plotly_chart(fig_timeline_escopo, use_container_width=True)
-            
-            # Visualização gráfica do progresso por instituição para este escopo
-            st.write(f"## Progresso por Instituição - {escopo}")
-            fig_instituicao = create_progress_chart(filtered_data, 'Instituição', cores_por_tipo, escopo)
-            st.plotly_chart(fig_instituicao, use_container_width=True)
-            
-            # Se apenas uma instituição estiver selecionada, mostrar progresso por unidade para este escopo
-            if len(instituicoes_selecionadas) == 1:
-                st.write(f"## Progresso por Unidade - {escopo}")
-                fig_unidade = create_progress_chart(filtered_data, 'Unidade', cores_por_tipo, escopo)
-                st.plotly_chart(fig_unidade, use_container_width=True)
-                
-                # Se uma instituição e uma unidade estiverem selecionadas, mostrar gráfico de linha do tempo específico
-                if len(unidades_selecionadas) == 1 and unidades_selecionadas[0] != 'Todos':
-                    st.write(f"## Evolução na {unidades_selecionadas[0]} - {escopo}")
-                    fig_timeline_unidade = create_timeline_chart(filtered_data, cores_por_tipo, escopo, 
-                                                               instituicoes_selecionadas[0], unidades_selecionadas[0])
-                    st.plotly_chart(fig_timeline_unidade, use_container_width=True)
-            
-            # Mostrar tabela detalhada para este escopo
-            with st.expander(f"Dados Detalhados - {escopo}"):
-                display_df = escopo_data.copy()
-                display_df['Data do Processamento'] = display_df['Data Formatada']
-                display_df = display_df.drop('Data Formatada', axis=1)
-                st.dataframe(display_df, hide_index=True)
+    # Resumo de todos os escopos calculado uma única vez para todas as abas
+    with etapa('calcular_resumo', linhas=len(dados['resumo'])):
+        resumo = calcular_resumo(dados['resumo'], list(cores_por_tipo.keys()))
+
+    # Seletor de visão: somente a visão escolhida tem seus gráficos calculados e serializados
+    visao = st.radio("Visão", ["Visão Geral"] + escopos + ["Tendências"], horizontal=True,
+                     label_visibility="collapsed", key="visao")
+
+    if visao == "Visão Geral":
+        render_overview(dados, resumo, filtered_data, filtros, cores_por_tipo, versao)
+    elif visao == "Tendências":
+        render_trends(filtros, versao)
+    else:
+        render_scope(visao, dados, resumo, filtered_data, filtros, cores_por_tipo, versao)
+
+# Function to render the "Tendências" view: resolution speed, projected date to reach zero
+# "Inconsistente" items and the stalled entities, sorted and filtered in the page
+def render_trends(filtros, versao):
+    st.write("## Tendências de Resolução")
+    st.write("Velocidade de redução das inconsistências (situações \"Inconsistente\", todos os escopos) "
+             "no último processamento do período selecionado.")
+
+    ordenacoes = {
+        'Dias sem redução': ('dias_sem_reducao', False),
+        'Velocidade (menor primeiro)': ('velocidade', True),
+        'Inconsistências': ('inconsistentes', False),
+        'Previsão para zerar': ('data_projetada_zero', True),
+    }
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        entity_type = st.radio("Nível", ['Instituição', 'Unidade'], horizontal=True, key="tendencia_nivel")
+    with col2:
+        ordem = st.selectbox("Ordenar por", list(ordenacoes), key="tendencia_ordem")
+    with col3:
+        somente_paradas = st.checkbox(f"Somente sem redução há {DIAS_PARADA} dias ou mais", key="tendencia_paradas")
+
+    with etapa('query_trends', entidade=entity_type) as registro:
+        conn = create_connection()
+        if conn is None:
+            return
+        tendencias = query_trends(conn, filtros, entity_type, versao)
+        close_connection(conn)
+        registro['linhas'] = contar_linhas(tendencias)
+    if tendencias is None:
+        return
+    if tendencias.empty:
+        st.info("Não há métricas de tendência para os filtros selecionados.")
+        return
+
+    # Somente entidades com inconsistências pendentes podem estar paradas
+    paradas = (tendencias['inconsistentes'] > 0) & (tendencias['dias_sem_reducao'] >= DIAS_PARADA)
+    velocidade_total = tendencias['velocidade'].sum()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Inconsistentes", f"{tendencias['inconsistentes'].sum():,}".replace(",", "."))
+    col2.metric("Resolvidas por dia", f"{velocidade_total:,.0f}".replace(",", "."))
+    col3.metric(f"Sem redução há {DIAS_PARADA}+ dias", f"{paradas.sum()} de {len(tendencias)}")
+
+    coluna, crescente = ordenacoes[ordem]
+    tabela = tendencias[paradas] if somente_paradas else tendencias
+    tabela = tabela.sort_values(coluna, ascending=crescente, na_position='last')
+    st.dataframe(
+        tabela.drop(columns='Data do Processamento'),
+        hide_index=True,
+        column_config={
+            'inconsistentes': st.column_config.NumberColumn("Inconsistentes", format="%d"),
+            'reducao_diaria': st.column_config.NumberColumn("Redução no último dia", format="%.0f"),
+            'velocidade': st.column_config.NumberColumn("Resolvidas por dia", format="%.1f"),
+            'data_projetada_zero': st.column_config.DateColumn("Previsão para zerar", format="DD/MM/YYYY"),
+            'dias_sem_reducao': st.column_config.NumberColumn("Dias sem redução", format="%d"),
+        },
+    )
+
+# Function to show the hidden debug panel (?debug=1): the stages of this run and a cProfile toggle
+def render_debug_panel(execucao, resumo, perfil=None):
+    with st.expander("Depuração"):
+        if execucao is not None:
+            st.write(f"Execução {execucao.id}: {resumo['duracao_ms']} ms, "
+                     f"memória residente {resumo['memoria_residente_mb']} MB")
+            st.dataframe(pd.DataFrame(execucao.etapas), hide_index=True)
+        st.button("Capturar perfil (cProfile) na próxima execução",
+                  on_click=lambda: st.session_state.update(capturar_perfil=True))
+        if perfil is not None:
+            caminho, texto = perfil
+            st.write(f"Perfil gravado em `{caminho}`")
+            st.code(texto)
+
+# Function to run the page with the opt-in instrumentation. A cProfile capture covers a single
+# rerun, requested from the debug panel or with ?perfil=1 (removed from the URL once used).
+def run_page():
+    debug = st.query_params.get('debug') == '1'
+    capturar = st.session_state.pop('capturar_perfil', False) or st.query_params.get('perfil') == '1'
+    if 'perfil' in st.query_params:
+        del st.query_params['perfil']
+
+    execucao = iniciar_execucao(INSTRUMENTACAO or debug or capturar)
+    perfilador = iniciar_perfil() if capturar else None
+    try:
+        main()
+    finally:
+        perfil = encerrar_perfil(perfilador) if perfilador is not None else None
+        resumo = encerrar_execucao(execucao)
+    if debug:
+        render_debug_panel(execucao, resumo, perfil)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_page()
\ No newline at end of file
@@ -0,0 +1,67 @@
+import hashlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que imita a exportação CSV dos cards do Metabase, para testes da extração
+# e benchmarks: responde POST /api/card/<id>/query/csv com o arquivo configurado para o card,
+# com ETag/If-None-Match, e pode simular falhas transitórias (503) e latência.
+
+# Function to start the mock server in a background thread. cartoes maps card id -> CSV path;
+# the first `falhas` requests of each card answer 503. Returns the server (server.shutdown() stops it).
+def iniciar_servidor(cartoes, porta=0, falhas=0, latencia=0.0):
+    tentativas = {}
+    trava = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            partes = self.path.strip('/').split('/')
+            card_id = int(partes[2]) if len(partes) == 5 and partes[2].isdigit() else None
+            if card_id not in cartoes:
+                self.send_error(404)
+                return
+            with trava:
+                tentativas[card_id] = tentativas.get(card_id, 0) + 1
+                falhar = tentativas[card_id] <= falhas
+            if latencia:
+                time.sleep(latencia)
+            if falhar:
+                self.send_error(503)
+                return
+
+            with open(cartoes[card_id], 'rb') as f:
+                corpo = f.read()
+            etag = f'"{hashlib.sha256(corpo).hexdigest()[:16]}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), Handler)
+    servidor.tentativas = tentativas
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+if __name__ == '__main__':
+    # Uso: python metabase_local.py 71=data/dados-2025-03-15.csv [--porta 8765] [--falhas N]
+    porta = int(sys.argv[sys.argv.index('--porta') + 1]) if '--porta' in sys.argv else 8765
+    falhas = int(sys.argv[sys.argv.index('--falhas') + 1]) if '--falhas' in sys.argv else 0
+    cartoes = {int(card_id): caminho for card_id, caminho in
+               (argumento.split('=', 1) for argumento in sys.argv[1:] if '=' in argumento)}
+    servidor = iniciar_servidor(cartoes, porta, falhas)
+    print(f"Metabase local em http://127.0.0.1:{servidor.server_address[1]} (cards: {sorted(cartoes)})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,344 @@
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from archive import registrar_arquivo
+from rollups import TABELA_HIERARQUIA, tabelas_agregadas_existem
+from schema import DIMENSOES
+
+# Colunas de agrupamento usadas pelos gráficos
+COL_DATA = '"Data do Processamento"'
+COL_INSTITUICAO = '"Instituição"'
+COL_UNIDADE = '"Unidade"'
+COL_ESCOPO = '"Escopo da Inconsistência"'
+COL_SITUACAO = '"Situação da Inconsistência"'
+COL_TOTAL = '"Total de Inconsistências"'
+
+# Estado normalizado dos filtros da barra lateral.
+# Tuplas vazias significam "Todos" (sem restrição).
+@dataclass(frozen=True)
+class Filtros:
+    data_inicial: Optional[date] = None
+    data_final: Optional[date] = None
+    instituicoes: Tuple[str, ...] = ()
+    unidades: Tuple[str, ...] = ()
+    escopos: Tuple[str, ...] = ()
+
+# Function to normalize the sidebar selections into a Filtros instance
+def criar_filtros(data_inicial=None, data_final=None, instituicoes=None, unidades=None, escopos=None):
+    def normalizar(valores):
+        if not valores or 'Todos' in valores:
+            return ()
+        return tuple(sorted(set(valores)))
+
+    return Filtros(
+        data_inicial=data_inicial,
+        data_final=data_final,
+        instituicoes=normalizar(instituicoes),
+        unidades=normalizar(unidades),
+        escopos=normalizar(escopos),
+    )
+
+# Function to translate the filters into a parameterized WHERE clause.
+# With por_chave=True the labels are translated into the integer keys of the dimensions.
+def montar_where(filtros, coluna_data=COL_DATA, por_chave=False):
+    condicoes = []
+    parametros = []
+    if filtros.data_inicial is not None:
+        condicoes.append(f"{coluna_data} >= ?")
+        parametros.append(filtros.data_inicial)
+    if filtros.data_final is not None:
+        condicoes.append(f"{coluna_data} <= ?")
+        parametros.append(filtros.data_final)
+    for rotulo, valores in (('Instituição', filtros.instituicoes),
+                            ('Unidade', filtros.unidades),
+                            ('Escopo da Inconsistência', filtros.escopos)):
+        if valores:
+            marcadores = ", ".join("?" for _ in valores)
+            if por_chave:
+                tabela, chave, _ = DIMENSOES[rotulo]
+                condicoes.append(f'{chave} IN (SELECT {chave} FROM {tabela} WHERE "{rotulo}" IN ({marcadores}))')
+            else:
+                condicoes.append(f'"{rotulo}" IN ({marcadores})')
+            parametros.extend(valores)
+
+    where = "WHERE " + " AND ".join(condicoes) if condicoes else ""
+    return where, parametros
+
+# Function to choose the smallest table that can answer a query.
+# Uses the rollups maintained at ingest when present, otherwise the raw pnp_data table.
+def tabela_origem(conn, filtros, dimensoes=()):
+    if not tabelas_agregadas_existem(conn):
+        return 'pnp_data'
+    if filtros.unidades or 'Unidade' in dimensoes:
+        return 'pnp_agregado_unidade'
+    if filtros.instituicoes or 'Instituição' in dimensoes:
+        return 'pnp_agregado_instituicao'
+    return 'pnp_agregado_situacao'
+
+def _por_chave(tabela):
+    return tabela.startswith('pnp_agregado')
+
+# Function to build the select list of the given dimensions for a source table
+def _colunas(tabela, rotulos):
+    return ", ".join(DIMENSOES[rotulo][1] if _por_chave(tabela) else f'"{rotulo}"' for rotulo in rotulos)
+
+# Function to map the integer keys of a dimension to the codes of a pandas category
+def _categorias(conn, rotulo):
+    tabela, chave, _ = DIMENSOES[rotulo]
+    dimensao = conn.execute(f'SELECT {chave}, "{rotulo}" FROM {tabela}').fetchdf()
+    categorias = pd.Index(sorted(dimensao[rotulo].dropna().unique()))
+    codigos = np.full(int(dimensao[chave].max()) + 1 if len(dimensao) else 0, -1)
+    codigos[dimensao[chave].to_numpy()] = categorias.get_indexer(dimensao[rotulo])
+    return codigos, categorias
+
+# Function to turn key or label columns into category columns named after the labels.
+# Labels are only attached as categories; the data itself stays as integer codes.
+def _resolver_rotulos(conn, df):
+    for rotulo, (_, chave, _) in DIMENSOES.items():
+        if chave in df.columns:
+            codigos, categorias = _categorias(conn, rotulo)
+            df[chave] = pd.Categorical.from_codes(codigos[df[chave].to_numpy()], categories=categorias)
+            df = df.rename(columns={chave: rotulo})
+        elif rotulo in df.columns:
+            df[rotulo] = df[rotulo].astype('category')
+    return df
+
+def _executar(conn, sql, parametros):
+    df = conn.execute(sql, parametros).fetchdf()
+    if 'Data do Processamento' in df.columns:
+        df['Data do Processamento'] = pd.to_datetime(df['Data do Processamento'])
+    return _resolver_rotulos(conn, df)
+
+# Function to query the version of the loaded data (latest processing date)
+def consultar_versao(conn):
+    return conn.execute(f"SELECT MAX({COL_DATA}) FROM {tabela_origem(conn, Filtros())}").fetchone()[0]
+
+# Function to query the date bounds and the options for the sidebar filters.
+# Reads the small metadata table refreshed at ingest when present, otherwise scans the data.
+def consultar_opcoes(conn):
+    metadados = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [TABELA_HIERARQUIA]).fetchone()[0] > 0
+    if metadados and tabelas_agregadas_existem(conn):
+        datas = conn.execute(f"SELECT MIN(primeira_data), MAX(ultima_data) FROM {TABELA_HIERARQUIA}").fetchone()
+        origem = f"{TABELA_HIERARQUIA} JOIN dim_instituicao USING (instituicao_id) JOIN dim_unidade USING (unidade_id)"
+    else:
+        tabela = tabela_origem(conn, Filtros())
+        datas = conn.execute(f"SELECT MIN({COL_DATA}), MAX({COL_DATA}) FROM {tabela}").fetchone()
+        if _por_chave(tabela):
+            origem = "dim_unidade JOIN dim_instituicao USING (instituicao_id)"
+        else:
+            origem = "pnp_data"
+    hierarquia = conn.execute(f"""
+        SELECT DISTINCT {COL_INSTITUICAO}, {COL_UNIDADE}
+        FROM {origem}
+        ORDER BY 1, 2
+    """).fetchdf()
+    return datas[0], datas[1], hierarquia
+
+# Índice da hierarquia Instituição -> Unidades usado pela barra lateral, montado uma vez por
+# versão dos dados: as opções de unidade de uma seleção custam O(unidades selecionadas).
+@dataclass(frozen=True)
+class IndiceHierarquia:
+    unidades_por_instituicao: Dict[str, Tuple[str, ...]]
+    unidades: Tuple[str, ...]
+
+# Function to build the hierarchy index from the (Instituição, Unidade) pairs
+def indexar_hierarquia(hierarquia):
+    por_instituicao = {
+        instituicao: tuple(sorted(grupo['Unidade'].unique()))
+        for instituicao, grupo in hierarquia.groupby('Instituição', sort=True)
+    }
+    return IndiceHierarquia(por_instituicao, tuple(sorted(hierarquia['Unidade'].unique())))
+
+# Function to list the unit options of the selected institutions (all units when empty)
+def unidades_de(indice, instituicoes=()):
+    if not instituicoes:
+        return list(indice.unidades)
+    unidades = set()
+    for instituicao in instituicoes:
+        unidades.update(indice.unidades_por_instituicao.get(instituicao, ()))
+    return sorted(unidades)
+
+# Function to query the filtered rows grouped by every dimension (detail table)
+def consultar_detalhe(conn, filtros):
+    tabela = tabela_origem(conn, filtros, ('Unidade',))
+    colunas = _colunas(tabela, DIMENSOES)
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    return _executar(conn, f"""
+        SELECT {COL_DATA}, {colunas},
+               SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM {tabela}
+        {where}
+        GROUP BY ALL
+        ORDER BY ALL
+    """, parametros)
+
+# Function to query a fingerprint of the filtered detail of each Instituição: any change in
+# its rows (totals, units, dates) changes the value. Used to skip unchanged static reports.
+def consultar_assinaturas(conn, filtros):
+    tabela = tabela_origem(conn, filtros, ('Unidade',))
+    colunas = _colunas(tabela, DIMENSOES)
+    instituicao = _colunas(tabela, ['Instituição'])
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    return _executar(conn, f"""
+        SELECT {instituicao}, COUNT(*) AS linhas,
+               BIT_XOR(hash({COL_DATA}, {colunas}, {COL_TOTAL})) AS assinatura
+        FROM {tabela}
+        {where}
+        GROUP BY ALL
+    """, parametros)
+
+# Function to build the SQL of the filtered detail with the dimension labels (no pandas
+# involved), used by the exports: returns the query and its parameters
+def montar_consulta_exportacao(conn, filtros):
+    tabela = tabela_origem(conn, filtros, ('Unidade',))
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    rotulos = ", ".join(f'"{rotulo}"' for rotulo in DIMENSOES)
+    juncoes = """
+        JOIN dim_instituicao USING (instituicao_id)
+        JOIN dim_unidade u ON u.unidade_id = filtrado.unidade_id
+        JOIN dim_escopo USING (escopo_id)
+        JOIN dim_situacao USING (situacao_id)
+    """ if _por_chave(tabela) else ""
+    return f"""
+        WITH filtrado AS (
+            SELECT * FROM {tabela} {where}
+        )
+        SELECT {COL_DATA}, {rotulos}, SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM filtrado
+        {juncoes}
+        GROUP BY ALL
+        ORDER BY ALL
+    """, parametros
+
+# Níveis do índice ordenado do detalhe: a data primeiro, para que o período selecionado seja
+# uma fatia contígua, seguida da hierarquia
+NIVEIS_DETALHE = ['Data do Processamento', 'Instituição', 'Unidade']
+
+# Function to index the whole detail history by a sorted MultiIndex (date, Instituição, Unidade).
+# Built once per data version; selections are then served by selecionar_detalhe.
+def indexar_detalhe(detalhe):
+    return detalhe.set_index(NIVEIS_DETALHE).sort_index()
+
+# Function to select the rows of the filters from the indexed detail. The sorted index turns
+# the period and the hierarchy into binary searches, so the cost follows the result size
+# instead of the history size.
+def selecionar_detalhe(indice, filtros):
+    inicio = pd.Timestamp(filtros.data_inicial) if filtros.data_inicial is not None else None
+    fim = pd.Timestamp(filtros.data_final) if filtros.data_final is not None else None
+    chave = (slice(inicio, fim),
+             list(filtros.instituicoes) if filtros.instituicoes else slice(None),
+             list(filtros.unidades) if filtros.unidades else slice(None))
+    try:
+        selecao = indice.loc[chave, :]
+    except KeyError:
+        selecao = indice.iloc[:0]
+    if filtros.escopos:
+        selecao = selecao[selecao['Escopo da Inconsistência'].isin(filtros.escopos)]
+    return selecao.reset_index()
+
+# Function to query the timeline series (date x escopo x situação)
+def consultar_linha_do_tempo(conn, filtros):
+    tabela = tabela_origem(conn, filtros)
+    colunas = _colunas(tabela, ['Escopo da Inconsistência', 'Situação da Inconsistência'])
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    return _executar(conn, f"""
+        SELECT {COL_DATA}, {colunas},
+               SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM {tabela}
+        {where}
+        GROUP BY ALL
+        ORDER BY 1
+    """, parametros)
+
+# Function to query the totals of the latest processing date per entity
+# (entity x escopo x situação), used by the progress charts
+def consultar_progresso(conn, filtros, entity_type):
+    if entity_type not in ('Instituição', 'Unidade'):
+        raise ValueError(f"Entidade inválida: {entity_type}")
+    tabela = tabela_origem(conn, filtros, (entity_type,))
+    colunas = _colunas(tabela, [entity_type, 'Escopo da Inconsistência', 'Situação da Inconsistência'])
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    return _executar(conn, f"""
+        WITH filtrado AS (
+            SELECT * FROM {tabela} {where}
+        )
+        SELECT {COL_DATA}, {colunas},
+               SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM filtrado
+        WHERE {COL_DATA} = (SELECT MAX({COL_DATA}) FROM filtrado)
+        GROUP BY ALL
+    """, parametros)
+
+# Function to query the totals of the last two processing dates
+# (date x escopo x situação), used by the summary cards
+def consultar_resumo(conn, filtros):
+    tabela = tabela_origem(conn, filtros)
+    colunas = _colunas(tabela, ['Escopo da Inconsistência', 'Situação da Inconsistência'])
+    where, parametros = montar_where(filtros, por_chave=_por_chave(tabela))
+    return _executar(conn, f"""
+        WITH filtrado AS (
+            SELECT * FROM {tabela} {where}
+        ),
+        ultimas_datas AS (
+            SELECT DISTINCT {COL_DATA} FROM filtrado ORDER BY 1 DESC LIMIT 2
+        )
+        SELECT {COL_DATA}, {colunas},
+               SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM filtrado
+        WHERE {COL_DATA} IN (SELECT {COL_DATA} FROM ultimas_datas)
+        GROUP BY ALL
+        ORDER BY 1
+    """, parametros)
+
+# Function to query the detail rows of the Parquet archive.
+# The date range is applied to the "data" partition column, so only the files
+# of the requested dates are read.
+def consultar_arquivo(conn, filtros):
+    if not registrar_arquivo(conn):
+        return pd.DataFrame(columns=['Data do Processamento', 'Instituição', 'Unidade',
+                                     'Escopo da Inconsistência', 'Situação da Inconsistência',
+                                     'Total de Inconsistências'])
+    where, parametros = montar_where(filtros, coluna_data='data')
+    return _executar(conn, f"""
+        SELECT {COL_DATA}, {COL_INSTITUICAO}, {COL_UNIDADE}, {COL_ESCOPO}, {COL_SITUACAO},
+               SUM({COL_TOTAL})::BIGINT AS {COL_TOTAL}
+        FROM pnp_arquivo
+        {where}
+        GROUP BY ALL
+        ORDER BY 1, 2, 3, 4, 5
+    """, parametros)
+
+# Function to query the trend metrics (pnp_tendencia_*) of the latest processing date up to the
+# end of the selected period, per Instituição or Unidade. The trends cover every escopo, so
+# the escopo filter and the start date do not apply.
+def consultar_tendencias(conn, filtros, entity_type):
+    tabela = {'Instituição': 'pnp_tendencia_instituicao', 'Unidade': 'pnp_tendencia_unidade'}.get(entity_type)
+    if tabela is None:
+        raise ValueError(f"Entidade inválida: {entity_type}")
+    rotulos = ['Instituição'] if entity_type == 'Instituição' else ['Instituição', 'Unidade']
+    existe = conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [tabela]).fetchone()[0] > 0
+    if not existe:
+        return pd.DataFrame(columns=['Data do Processamento'] + rotulos)
+
+    filtros = replace(filtros, data_inicial=None, escopos=())
+    if entity_type == 'Instituição':
+        filtros = replace(filtros, unidades=())
+    where, parametros = montar_where(filtros, por_chave=True)
+    colunas = ", ".join(DIMENSOES[rotulo][1] for rotulo in rotulos)
+    return _executar(conn, f"""
+        WITH filtrado AS (
+            SELECT * FROM {tabela} {where}
+        )
+        SELECT {COL_DATA}, {colunas}, inconsistentes, reducao_diaria, velocidade,
+               data_projetada_zero,
+               -- Entidades sem inconsistências não estão paradas (vale também para métricas
+               -- calculadas antes desta regra)
+               CASE WHEN inconsistentes > 0 THEN dias_sem_reducao END AS dias_sem_reducao
+        FROM filtrado
+        WHERE {COL_DATA} = (SELECT MAX({COL_DATA}) FROM filtrado)
+    """, parametros)
@@ -0,0 +1,84 @@
+import math
+import os
+
+import pandas as pd
+
+# Limites da camada de redução dos dados enviados aos gráficos.
+# MAX_PONTOS_LINHA_DO_TEMPO: datas por série antes de agregar por semana/mês.
+# TOP_N_PROGRESSO: barras por página nos gráficos de progresso (as demais vão para "Outros").
+# MAX_BYTES_FIGURA: tamanho máximo do JSON de uma figura enviado ao navegador.
+# LINHAS_POR_PAGINA_TABELA: linhas das tabelas detalhadas por página (o restante só na exportação).
+MAX_PONTOS_LINHA_DO_TEMPO = int(os.environ.get('PNP_MAX_PONTOS_LINHA_DO_TEMPO', 120))
+TOP_N_PROGRESSO = int(os.environ.get('PNP_TOP_N_PROGRESSO', 30))
+MAX_BYTES_FIGURA = int(os.environ.get('PNP_MAX_BYTES_FIGURA', 1024 * 1024))
+LINHAS_POR_PAGINA_TABELA = int(os.environ.get('PNP_LINHAS_POR_PAGINA_TABELA', 1000))
+
+ROTULO_OUTROS = 'Outros'
+
+# Granularidades tentadas em ordem, da mais detalhada para a mais agregada
+GRANULARIDADES = (
+    ('diária', None),
+    ('semanal', 'W'),
+    ('mensal', 'M'),
+)
+
+# Function to reduce a timeline to at most max_pontos dates per series.
+# Totals are snapshots (stock, not flow), so each week/month keeps the values of its
+# latest processing date instead of summing the days. Returns the frame and the granularity.
+def reduzir_linha_do_tempo(data, max_pontos=MAX_PONTOS_LINHA_DO_TEMPO):
+    datas = pd.Series(data['Data do Processamento'].unique())
+    for granularidade, frequencia in GRANULARIDADES:
+        periodos = datas if frequencia is None else datas.dt.to_period(frequencia)
+        if periodos.nunique() <= max_pontos:
+            break
+
+    if frequencia is None:
+        return data, granularidade
+    ultimas = datas.groupby(periodos.to_numpy()).max()
+    return data[data['Data do Processamento'].isin(ultimas)], granularidade
+
+# Function to count the entities a progress chart would show
+def contar_entidades(data, entity_type, escopo_filter=None):
+    if data.empty:
+        return 0
+    if escopo_filter:
+        data = data[data['Escopo da Inconsistência'] == escopo_filter]
+    return data[entity_type].nunique()
+
+# Function to compute the number of pages of top_n entities
+def total_paginas(total_itens, top_n=TOP_N_PROGRESSO):
+    return max(1, math.ceil(total_itens / max(1, top_n)))
+
+# Function to keep one page of the entities of a pivot (ranked by total, largest first).
+# Returns the page and a single "Outros" row summing every other entity (None if there are none).
+def selecionar_pagina(pivot_df, entity_type, colunas, top_n=TOP_N_PROGRESSO, pagina=1):
+    if len(pivot_df) <= top_n:
+        return pivot_df, None
+
+    ranking = pivot_df.sort_values([colunas[-1], entity_type], ascending=[False, True], kind='stable')
+    inicio = (pagina - 1) * top_n
+    pagina_df = ranking.iloc[inicio:inicio + top_n]
+    restantes = ranking.drop(pagina_df.index)
+    if restantes.empty:
+        return pagina_df, None
+
+    outros = restantes[colunas].sum().to_frame().T
+    outros.insert(0, entity_type, f"{ROTULO_OUTROS} ({len(restantes)})")
+    return pagina_df, outros
+
+# Function to measure the JSON payload of a Plotly figure
+def tamanho_figura(fig):
+    return len(fig.to_json().encode('utf-8'))
+
+# Function to build a figure within the payload limit: while the JSON is too large,
+# the figure is rebuilt with half the points/bars. Returns the figure and the limit used.
+def ajustar_payload(construir, limite, max_bytes=MAX_BYTES_FIGURA):
+    fig = construir(limite)
+    while limite > 1 and tamanho_figura(fig) > max_bytes:
+        limite = max(1, limite // 2)
+        fig = construir(limite)
+    return fig, limite
+
+# Function to build a figure within the payload limit
+def limitar_payload(construir, limite, max_bytes=MAX_BYTES_FIGURA):
+    return ajustar_payload(construir, limite, max_bytes)[0]
@@ -0,0 +1,208 @@
+import argparse
+import html
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from plotly.offline import get_plotlyjs
+
+from database import conexao_compartilhada
+from estado import carregar_estado, salvar_estado
+from exportacao import nome_seguro
+from main import CORES_POR_TIPO, calcular_resumo, create_progress_chart, create_timeline_chart, formatar_metrica
+from queries import (
+    consultar_assinaturas,
+    consultar_linha_do_tempo,
+    consultar_opcoes,
+    consultar_progresso,
+    consultar_resumo,
+    criar_filtros,
+)
+from reducao import contar_entidades
+
+# Relatórios estáticos em HTML, um por Instituição, gerados em lote após cada carga com os
+# mesmos resumos e gráficos do painel, para distribuição sem passar pelo Streamlit.
+# Cada relatório cobre os últimos DIAS_RELATORIO dias (o período padrão do painel) e só é
+# refeito quando a assinatura dos seus dados muda.
+RELATORIOS_DIR = os.environ.get('PNP_RELATORIOS_DIR', 'relatorios')
+DIAS_RELATORIO = int(os.environ.get('PNP_DIAS_RELATORIO', 30))
+MAX_PROCESSOS = int(os.environ.get('PNP_RELATORIOS_PROCESSOS', os.cpu_count() or 1))
+
+ESTILO = """
+body { font-family: sans-serif; margin: 2em auto; max-width: 1200px; color: #262730; }
+.cards { display: grid; grid-template-columns: repeat(4, 1fr); gap: 1em; margin-bottom: 1em; }
+.card { padding: 0.5em 0; }
+.card .rotulo { font-size: 0.9em; }
+.card .valor { font-size: 1.8em; }
+.card .evolucao { font-size: 0.9em; color: #808495; }
+.card .bom { color: #09AB3B; }
+.card .ruim { color: #FF2B2B; }
+"""
+
+# Estado dos relatórios gerados (assinatura e arquivo de cada Instituição), guardado junto aos HTMLs
+def _estado_path(destino_dir):
+    return os.path.join(destino_dir, '.relatorios.json')
+
+# Function to write a file atomically, so the static server never serves a partial report
+def _gravar(caminho, conteudo):
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+# Function to render the summary cards of one escopo as HTML, with the layout and the
+# formatting of create_summary_cards
+def resumo_html(resumo, tipos_inconsistencia, escopo_filter=None):
+    escopo = escopo_filter or 'Todos'
+    if resumo.empty or escopo not in resumo.index.get_level_values(0):
+        return ""
+    resumo_escopo = resumo.loc[escopo]
+
+    titulo = "Total de Inconsistências"
+    if escopo_filter:
+        titulo += f" ({escopo_filter})"
+    valor, _ = formatar_metrica('Total', resumo_escopo)
+    cards = [f'<div class="card"><div class="rotulo">{html.escape(titulo)}</div><div class="valor">{valor}</div></div>']
+    for posicao, tipo in enumerate(tipos_inconsistencia):
+        valor, evolucao = formatar_metrica(tipo, resumo_escopo)
+        evolucao_pct = resumo_escopo.loc[tipo, 'evolucao_pct']
+        classe = "evolucao"
+        if evolucao_pct != 0 and evolucao != '-':
+            # Como nos cards do painel, só o primeiro tipo (Inconsistente RA) tem a cor invertida
+            classe += ' bom' if (evolucao_pct < 0) == (posicao == 0) else ' ruim'
+        cards.append(f'<div class="card"><div class="rotulo">{html.escape(tipo)}</div>'
+                     f'<div class="valor">{valor}</div><div class="{classe}">{evolucao}</div></div>')
+    return ('<div class="cards"><div></div>' + cards[0] + '<div></div><div></div></div>'
+            '<div class="cards">' + "".join(cards[1:]) + '</div>')
+
+# Function to render the report of one Instituição to destino. Runs in a worker process,
+# with its own connection, reusing the queries, the summary and the charts of the dashboard.
+def gerar_relatorio(instituicao, filtros, destino):
+    tipos = list(CORES_POR_TIPO.keys())
+    conn = conexao_compartilhada.cursor()
+    try:
+        resumo = calcular_resumo(consultar_resumo(conn, filtros), tipos)
+        linha_do_tempo = consultar_linha_do_tempo(conn, filtros)
+        progresso = consultar_progresso(conn, filtros, 'Unidade')
+    finally:
+        conn.close()
+
+    escopos = [escopo for escopo in resumo.index.get_level_values(0).unique() if escopo != 'Todos']
+    timeline = create_timeline_chart(linha_do_tempo, CORES_POR_TIPO, instituicao_filter=instituicao)
+    # O relatório estático não é paginado: todas as unidades em um único gráfico
+    unidades = max(1, contar_entidades(progresso, 'Unidade'))
+    progresso_fig = create_progress_chart(progresso, 'Unidade', CORES_POR_TIPO, top_n=unidades)
+
+    data_processamento = linha_do_tempo['Data do Processamento'].max()
+    partes = [
+        f"<h1>{html.escape(instituicao)}</h1>",
+        f"<p>Processamento de {data_processamento:%d/%m/%Y}; período de "
+        f"{filtros.data_inicial:%d/%m/%Y} a {filtros.data_final:%d/%m/%Y}.</p>" if not linha_do_tempo.empty else "",
+        "<h2>Resumo Geral de Inconsistências</h2>",
+        resumo_html(resumo, tipos),
+    ]
+    for escopo in escopos:
+        partes += [f"<h2>Resumo de Inconsistências - {html.escape(escopo)}</h2>", resumo_html(resumo, tipos, escopo)]
+    partes += [
+        "<h2>Evolução das Inconsistências</h2>",
+        timeline.to_html(full_html=False, include_plotlyjs=False),
+        "<h2>Progresso por Unidade</h2>",
+        progresso_fig.to_html(full_html=False, include_plotlyjs=False),
+    ]
+    _gravar(destino, _pagina(f"PNP - {instituicao}", "\n".join(partes)))
+    return destino
+
+def _pagina(titulo, corpo):
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(titulo)}</title>
+<script src="plotly.min.js"></script>
+<style>{ESTILO}</style>
+</head>
+<body>
+{corpo}
+<p><small>Gerado em {datetime.now():%d/%m/%Y %H:%M}.</small></p>
+</body>
+</html>
+"""
+
+# Function to write the index page linking every report
+def escrever_indice(destino_dir, estado):
+    itens = "\n".join(
+        f'<li><a href="{html.escape(estado[instituicao]["arquivo"])}">{html.escape(instituicao)}</a></li>'
+        for instituicao in sorted(estado))
+    _gravar(os.path.join(destino_dir, 'index.html'),
+            _pagina("PNP - Relatórios por Instituição", f"<h1>Relatórios por Instituição</h1>\n<ul>\n{itens}\n</ul>"))
+
+# Function to generate the reports of every Instituição whose data changed since the last run,
+# in parallel across max_processos worker processes. Returns the Instituições regenerated.
+def gerar_relatorios(destino_dir=RELATORIOS_DIR, dias=DIAS_RELATORIO, max_processos=MAX_PROCESSOS, forcar=False):
+    conn = conexao_compartilhada.cursor()
+    try:
+        _, data_final, _ = consultar_opcoes(conn)
+        if data_final is None:
+            return []
+        filtros = criar_filtros(data_final - timedelta(days=dias), data_final)
+        assinaturas = consultar_assinaturas(conn, filtros)
+    finally:
+        conn.close()
+
+    os.makedirs(destino_dir, exist_ok=True)
+    plotlyjs_path = os.path.join(destino_dir, 'plotly.min.js')
+    if not os.path.exists(plotlyjs_path):
+        _gravar(plotlyjs_path, get_plotlyjs())
+
+    estado = carregar_estado(_estado_path(destino_dir))
+    pendentes = {}
+    for instituicao, linhas, assinatura in assinaturas.itertuples(index=False):
+        instituicao = str(instituicao)
+        chave = f"{filtros.data_inicial}/{filtros.data_final}/{linhas}/{assinatura}"
+        arquivo = f"{nome_seguro(instituicao)}.html"
+        anterior = estado.get(instituicao, {})
+        if not forcar and anterior.get('assinatura') == chave and os.path.exists(os.path.join(destino_dir, arquivo)):
+            continue
+        pendentes[instituicao] = (arquivo, chave)
+
+    gerados = []
+    if pendentes:
+        # spawn: os processos abrem suas próprias conexões, sem herdar a do processo principal
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max(1, min(max_processos, len(pendentes))), mp_context=contexto) as executor:
+            futuros = {
+                executor.submit(gerar_relatorio, instituicao, replace(filtros, instituicoes=(instituicao,)),
+                                os.path.join(destino_dir, arquivo)): instituicao
+                for instituicao, (arquivo, _) in pendentes.items()
+            }
+            for futuro in as_completed(futuros):
+                instituicao = futuros[futuro]
+                arquivo, chave = pendentes[instituicao]
+                try:
+                    futuro.result()
+                except Exception as e:
+                    print(f"Erro ao gerar o relatório de {instituicao}: {e}")
+                    continue
+                estado[instituicao] = {'assinatura': chave, 'arquivo': arquivo,
+                                       'gerado_em': datetime.now().isoformat(timespec='seconds')}
+                gerados.append(instituicao)
+
+    # Instituições sem dados no período deixam o índice
+    atuais = {str(instituicao) for instituicao in assinaturas['Instituição']}
+    estado = {instituicao: item for instituicao, item in estado.items() if instituicao in atuais}
+    salvar_estado(_estado_path(destino_dir), estado)
+    escrever_indice(destino_dir, estado)
+    return gerados
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera os relatórios estáticos por Instituição.")
+    parser.add_argument('--destino', default=RELATORIOS_DIR)
+    parser.add_argument('--dias', type=int, default=DIAS_RELATORIO)
+    parser.add_argument('--processos', type=int, default=MAX_PROCESSOS)
+    parser.add_argument('--forcar', action='store_true', help="refaz também os relatórios sem alterações")
+    args = parser.parse_args()
+
+    gerados = gerar_relatorios(args.destino, args.dias, args.processos, args.forcar)
+    print(f"{len(gerados)} relatório(s) gerado(s) em {args.destino}.")
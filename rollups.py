@@ -0,0 +1,130 @@
+from schema import DIMENSOES, garantir_dimensoes, juncao_dimensoes
+
+# Tabelas agregadas por dia mantidas na carga, do nível mais agregado ao mais detalhado.
+# Cada uma guarda o total de inconsistências por data x dimensões x escopo x situação,
+# com as dimensões representadas pelas chaves inteiras das tabelas dim_*.
+TABELAS_AGREGADAS = {
+    'pnp_agregado_situacao': [],
+    'pnp_agregado_instituicao': ['Instituição'],
+    'pnp_agregado_unidade': ['Instituição', 'Unidade'],
+}
+
+# Metadados dos filtros, mantidos na carga junto com os agregados: uma linha por
+# Instituição x Unidade com dados, com a primeira e a última data de processamento.
+# Os limites de data e a hierarquia da barra lateral são lidos desta tabela (poucas centenas
+# de linhas) em vez de varrer o histórico.
+TABELA_HIERARQUIA = 'pnp_hierarquia'
+
+def _chaves(dimensoes):
+    return [DIMENSOES[rotulo][1] for rotulo in
+            dimensoes + ['Escopo da Inconsistência', 'Situação da Inconsistência']]
+
+def _colunas(dimensoes):
+    return ", ".join(['"Data do Processamento"'] + _chaves(dimensoes))
+
+# Function to create the rollup tables if they do not exist
+def criar_tabelas_agregadas(conn):
+    for tabela, dimensoes in TABELAS_AGREGADAS.items():
+        definicoes = "".join(f"{DIMENSOES[rotulo][1]} {DIMENSOES[rotulo][2]}, "
+                             for rotulo in dimensoes + ['Escopo da Inconsistência', 'Situação da Inconsistência'])
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            "Data do Processamento" DATE,
+            {definicoes}
+            "Total de Inconsistências" BIGINT
+        )
+        """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABELA_HIERARQUIA} (
+        instituicao_id {DIMENSOES['Instituição'][2]},
+        unidade_id {DIMENSOES['Unidade'][2]},
+        primeira_data DATE,
+        ultima_data DATE
+    )
+    """)
+
+# Function to convert rollup tables created with label columns to the integer keys
+def migrar_agregados_legados(conn):
+    for tabela, dimensoes in TABELAS_AGREGADAS.items():
+        legado = conn.execute("""
+            SELECT COUNT(*) FROM duckdb_columns()
+            WHERE table_name = ? AND column_name = 'Escopo da Inconsistência'
+        """, [tabela]).fetchone()[0] > 0
+        if not legado:
+            continue
+
+        conn.execute(f"ALTER TABLE {tabela} RENAME TO {tabela}_legado")
+        if tabela == 'pnp_agregado_unidade':
+            # Datas já removidas de pnp_data podem existir apenas nos agregados
+            garantir_dimensoes(conn, f'{tabela}_legado')
+        criar_tabelas_agregadas(conn)
+        apelidos = {'Instituição': 'i', 'Unidade': 'u'}
+        chaves = "".join(f"{apelidos[rotulo]}.{DIMENSOES[rotulo][1]}, " for rotulo in dimensoes)
+        conn.execute(f"""
+        INSERT INTO {tabela}
+            SELECT o."Data do Processamento", {chaves}e.escopo_id, s.situacao_id, o."Total de Inconsistências"
+            FROM {tabela}_legado o
+            {juncao_dimensoes(dimensoes)}
+        """)
+        conn.execute(f"DROP TABLE {tabela}_legado")
+
+# Function to check whether the rollup tables are available in the database
+def tabelas_agregadas_existem(conn):
+    encontradas = conn.execute("""
+        SELECT COUNT(*) FROM duckdb_columns()
+        WHERE table_name IN (SELECT unnest(?)) AND column_name = 'escopo_id'
+    """, [list(TABELAS_AGREGADAS)]).fetchone()[0]
+    return encontradas == len(TABELAS_AGREGADAS)
+
+# Function to recompute the rollups for a single processing date
+def atualizar_data(conn, data_processamento):
+    for tabela, dimensoes in TABELAS_AGREGADAS.items():
+        colunas = _colunas(dimensoes)
+        conn.execute(f'DELETE FROM {tabela} WHERE "Data do Processamento" = ?', [data_processamento])
+        conn.execute(f"""
+        INSERT INTO {tabela}
+            SELECT {colunas}, SUM("Total de Inconsistências")
+            FROM pnp_fato
+            WHERE "Data do Processamento" = ?
+            GROUP BY {colunas}
+        """, [data_processamento])
+
+# Function to rebuild the filter metadata (hierarchy and date bounds) from the unit rollup
+def atualizar_hierarquia(conn):
+    conn.execute(f"DELETE FROM {TABELA_HIERARQUIA}")
+    conn.execute(f"""
+    INSERT INTO {TABELA_HIERARQUIA}
+        SELECT instituicao_id, unidade_id, MIN("Data do Processamento"), MAX("Data do Processamento")
+        FROM pnp_agregado_unidade
+        GROUP BY ALL
+        ORDER BY ALL
+    """)
+
+# Function to update the rollups for the given date plus any date not yet aggregated
+def atualizar_agregados(conn, data_processamento=None):
+    criar_tabelas_agregadas(conn)
+    pendentes = [linha[0] for linha in conn.execute("""
+        SELECT DISTINCT "Data do Processamento" FROM pnp_fato
+        EXCEPT
+        SELECT DISTINCT "Data do Processamento" FROM pnp_agregado_unidade
+        ORDER BY 1
+    """).fetchall()]
+    if data_processamento is not None and data_processamento not in pendentes:
+        pendentes.append(data_processamento)
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for data in pendentes:
+            atualizar_data(conn, data)
+        atualizar_hierarquia(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return pendentes
+
+if __name__ == '__main__':
+    from worker import executar_manutencao
+
+    datas = executar_manutencao(atualizar_agregados)
+    print(f"Agregados atualizados para {len(datas)} data(s) de processamento.")
@@ -0,0 +1,107 @@
+# Dimensões categóricas armazenadas uma única vez, com chaves inteiras pequenas.
+# Cada entrada: rótulo -> (tabela de dimensão, coluna de chave, tipo da chave).
+# As chaves são densas (0..n-1), o que permite montar categorias do pandas sem strings.
+DIMENSOES = {
+    'Instituição': ('dim_instituicao', 'instituicao_id', 'SMALLINT'),
+    'Unidade': ('dim_unidade', 'unidade_id', 'SMALLINT'),
+    'Escopo da Inconsistência': ('dim_escopo', 'escopo_id', 'TINYINT'),
+    'Situação da Inconsistência': ('dim_situacao', 'situacao_id', 'TINYINT'),
+}
+
+def _tabela_existe(conn, nome, tipo='BASE TABLE'):
+    return conn.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_name = ? AND table_type = ?
+    """, [nome, tipo]).fetchone()[0] > 0
+
+def juncao_dimensoes(rotulos=tuple(DIMENSOES), origem='o'):
+    juncoes = []
+    if 'Instituição' in rotulos:
+        juncoes.append(f'JOIN dim_instituicao i ON {origem}."Instituição" IS NOT DISTINCT FROM i."Instituição"')
+    if 'Unidade' in rotulos:
+        juncoes.append(f'JOIN dim_unidade u ON u.instituicao_id = i.instituicao_id '
+                       f'AND {origem}."Unidade" IS NOT DISTINCT FROM u."Unidade"')
+    juncoes.append(f'JOIN dim_escopo e ON {origem}."Escopo da Inconsistência" IS NOT DISTINCT FROM e."Escopo da Inconsistência"')
+    juncoes.append(f'JOIN dim_situacao s ON {origem}."Situação da Inconsistência" IS NOT DISTINCT FROM s."Situação da Inconsistência"')
+    return "\n".join(juncoes)
+
+# Function to create the dimension tables and the narrow fact table
+def criar_tabelas_dimensionais(conn):
+    for rotulo, (tabela, chave, tipo) in DIMENSOES.items():
+        pai = 'instituicao_id SMALLINT,' if tabela == 'dim_unidade' else ''
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            {chave} {tipo} PRIMARY KEY,
+            {pai}
+            "{rotulo}" VARCHAR
+        )
+        """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pnp_fato (
+        "Data do Processamento" DATE,
+        instituicao_id SMALLINT,
+        unidade_id SMALLINT,
+        escopo_id TINYINT,
+        situacao_id TINYINT,
+        "Total de Inconsistências" INTEGER
+    )
+    """)
+
+# Function to register the labels of a source table/relation missing from the dimensions
+def garantir_dimensoes(conn, origem):
+    for rotulo in ('Instituição', 'Escopo da Inconsistência', 'Situação da Inconsistência'):
+        tabela, chave, _ = DIMENSOES[rotulo]
+        conn.execute(f"""
+        INSERT INTO {tabela}
+            SELECT (SELECT COALESCE(MAX({chave}) + 1, 0) FROM {tabela}) + ROW_NUMBER() OVER (ORDER BY novo) - 1,
+                   novo
+            FROM (
+                SELECT DISTINCT o."{rotulo}" AS novo FROM {origem} o
+                ANTI JOIN {tabela} d ON o."{rotulo}" IS NOT DISTINCT FROM d."{rotulo}"
+            )
+        """)
+    conn.execute(f"""
+    INSERT INTO dim_unidade
+        SELECT (SELECT COALESCE(MAX(unidade_id) + 1, 0) FROM dim_unidade) + ROW_NUMBER() OVER (ORDER BY instituicao_id, novo) - 1,
+               instituicao_id, novo
+        FROM (
+            SELECT DISTINCT i.instituicao_id, o."Unidade" AS novo FROM {origem} o
+            JOIN dim_instituicao i ON o."Instituição" IS NOT DISTINCT FROM i."Instituição"
+            ANTI JOIN dim_unidade d ON d.instituicao_id = i.instituicao_id
+                                   AND o."Unidade" IS NOT DISTINCT FROM d."Unidade"
+        )
+    """)
+
+# Function to insert the rows of a labeled source into the fact table,
+# stamped with the given processing date (or keeping the source's date)
+def inserir_fatos(conn, origem, data_processamento=None):
+    data = '?::DATE' if data_processamento is not None else 'o."Data do Processamento"'
+    conn.execute(f"""
+    INSERT INTO pnp_fato
+        SELECT {data}, i.instituicao_id, u.unidade_id, e.escopo_id, s.situacao_id, o."Total de Inconsistências"
+        FROM {origem} o
+        {juncao_dimensoes()}
+    """, [data_processamento] if data_processamento is not None else [])
+
+# Function to create the pnp_data view, which keeps the original labeled layout over the fact table
+def criar_view_pnp_data(conn):
+    conn.execute("""
+    CREATE OR REPLACE VIEW pnp_data AS
+        SELECT i."Instituição", u."Unidade", e."Escopo da Inconsistência", s."Situação da Inconsistência",
+               f."Total de Inconsistências", f."Data do Processamento"
+        FROM pnp_fato f
+        JOIN dim_instituicao i USING (instituicao_id)
+        JOIN dim_unidade u USING (unidade_id)
+        JOIN dim_escopo e USING (escopo_id)
+        JOIN dim_situacao s USING (situacao_id)
+    """)
+
+# Function to migrate a database created with the labeled pnp_data table:
+# its rows move to the fact table and pnp_data is later recreated as a view
+def migrar_pnp_data_legado(conn):
+    if not _tabela_existe(conn, 'pnp_data'):
+        return False
+    garantir_dimensoes(conn, 'pnp_data')
+    inserir_fatos(conn, 'pnp_data')
+    conn.execute("DROP TABLE pnp_data")
+    return True
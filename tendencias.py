@@ -0,0 +1,117 @@
+import os
+
+from schema import DIMENSOES
+
+# Métricas de tendência por Instituição e por Unidade, calculadas na carga sobre o histórico
+# dos agregados. Para cada data de processamento:
+# - inconsistentes: total de itens em situação "Inconsistente" (RA e PI, todos os escopos);
+# - reducao_diaria: itens resolvidos por dia desde o processamento anterior;
+# - velocidade: itens resolvidos por dia na janela de JANELA_DIAS (inclinação da regressão linear);
+# - data_projetada_zero: data estimada para zerar as inconsistências mantida a velocidade;
+# - dias_sem_reducao: dias desde a última redução (unidades paradas); nulo quando não há mais
+#   inconsistências, pois uma unidade concluída não está parada.
+TABELAS_TENDENCIA = {
+    'pnp_tendencia_instituicao': ('pnp_agregado_instituicao', ['Instituição']),
+    'pnp_tendencia_unidade': ('pnp_agregado_unidade', ['Instituição', 'Unidade']),
+}
+JANELA_DIAS = int(os.environ.get('PNP_JANELA_TENDENCIA_DIAS', 14))
+
+# Dias sem redução a partir dos quais uma unidade é considerada parada
+DIAS_PARADA = int(os.environ.get('PNP_DIAS_PARADA', 7))
+
+# Limite da projeção (em dias), para velocidades muito próximas de zero
+MAX_DIAS_PROJECAO = 36500
+
+def _chaves(dimensoes):
+    return ", ".join(DIMENSOES[rotulo][1] for rotulo in dimensoes)
+
+# Function to create the trend tables if they do not exist
+def criar_tabelas_tendencia(conn):
+    for tabela, (_, dimensoes) in TABELAS_TENDENCIA.items():
+        definicoes = "".join(f"{DIMENSOES[rotulo][1]} {DIMENSOES[rotulo][2]}, " for rotulo in dimensoes)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            "Data do Processamento" DATE,
+            {definicoes}
+            inconsistentes BIGINT,
+            reducao_diaria DOUBLE,
+            velocidade DOUBLE,
+            data_projetada_zero DATE,
+            dias_sem_reducao INTEGER
+        )
+        """)
+
+# Function to recompute the trend metrics from the given processing date onwards.
+# The windows read the whole history of the (small) rollup tables, but only the rows
+# of the affected dates are rewritten.
+def atualizar_tendencias_desde(conn, data_processamento):
+    for tabela, (origem, dimensoes) in TABELAS_TENDENCIA.items():
+        chaves = _chaves(dimensoes)
+        conn.execute(f'DELETE FROM {tabela} WHERE "Data do Processamento" >= ?', [data_processamento])
+        conn.execute(f"""
+        INSERT INTO {tabela}
+        WITH diario AS (
+            SELECT a."Data do Processamento" AS data, {chaves},
+                   SUM(CASE WHEN s."Situação da Inconsistência" LIKE 'Inconsistente%'
+                            THEN a."Total de Inconsistências" ELSE 0 END) AS inconsistentes
+            FROM {origem} a
+            JOIN dim_situacao s USING (situacao_id)
+            GROUP BY ALL
+        ),
+        janela AS (
+            SELECT *,
+                   LAG(inconsistentes) OVER (PARTITION BY {chaves} ORDER BY data) AS anterior,
+                   LAG(data) OVER (PARTITION BY {chaves} ORDER BY data) AS data_anterior,
+                   -REGR_SLOPE(inconsistentes, date_diff('day', DATE '2000-01-01', data)) OVER recentes AS inclinacao,
+                   COUNT(*) OVER recentes AS pontos,
+                   MIN(data) OVER (PARTITION BY {chaves}) AS primeira_data
+            FROM diario
+            WINDOW recentes AS (PARTITION BY {chaves} ORDER BY data
+                                RANGE BETWEEN INTERVAL {JANELA_DIAS - 1} DAYS PRECEDING AND CURRENT ROW)
+        ),
+        marcado AS (
+            -- A velocidade exige ao menos dois processamentos na janela
+            SELECT *, CASE WHEN pontos >= 2 THEN inclinacao END AS velocidade,
+                   MAX(CASE WHEN inconsistentes < anterior THEN data END) OVER (
+                       PARTITION BY {chaves} ORDER BY data ROWS UNBOUNDED PRECEDING) AS ultima_reducao
+            FROM janela
+        )
+        SELECT data, {chaves}, inconsistentes,
+               (anterior - inconsistentes) / NULLIF(date_diff('day', data_anterior, data), 0),
+               velocidade,
+               CASE WHEN inconsistentes = 0 THEN data
+                    WHEN velocidade > 0 THEN data + CAST(LEAST(CEIL(inconsistentes / velocidade), {MAX_DIAS_PROJECAO}) AS INTEGER)
+               END,
+               CASE WHEN inconsistentes > 0 THEN date_diff('day', COALESCE(ultima_reducao, primeira_data), data) END
+        FROM marcado
+        WHERE data >= ?
+        """, [data_processamento])
+
+# Function to update the trend tables for the given date plus any aggregated date missing from them
+def atualizar_tendencias(conn, data_processamento=None):
+    criar_tabelas_tendencia(conn)
+    pendentes = [linha[0] for linha in conn.execute("""
+        SELECT DISTINCT "Data do Processamento" FROM pnp_agregado_unidade
+        EXCEPT
+        SELECT DISTINCT "Data do Processamento" FROM pnp_tendencia_unidade
+    """).fetchall()]
+    if data_processamento is not None:
+        pendentes.append(data_processamento)
+    if not pendentes:
+        return None
+
+    inicio = min(pendentes)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        atualizar_tendencias_desde(conn, inicio)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return inicio
+
+if __name__ == '__main__':
+    from worker import executar_manutencao
+
+    inicio = executar_manutencao(atualizar_tendencias)
+    print(f"Tendências atualizadas a partir de {inicio}." if inicio else "Tendências já atualizadas.")
@@ -0,0 +1,254 @@
+import csv
+import json
+import os
+import shutil
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+
+import duckdb
+
+from database import DB_PATH
+from rollups import tabelas_agregadas_existem
+from schema import DIMENSOES
+
+# Validação de cada snapshot antes da carga, feita pelo DuckDB sobre o arquivo (sem pandas).
+# Erros colocam o snapshot em quarentena (o arquivo sai de data/ e não é carregado);
+# avisos são apenas registrados. Toda validação fica em pnp_validacoes.
+
+# Colunas do snapshot, na ordem do arquivo (lidas por posição e nomeadas com os rótulos do painel)
+COLUNAS = list(DIMENSOES) + ['Total de Inconsistências']
+
+# Vocabulários aceitos para o escopo e a situação da inconsistência
+ESCOPOS_VALIDOS = ('Ciclo', 'Curso', 'Matrícula')
+SITUACOES_VALIDAS = (
+    'Inconsistente RA', 'Alterado RA', 'Validado RA',
+    'Inconsistente PI', 'Alterado PI', 'Validado PI',
+    'Alterado RE', 'Validado RE',
+)
+
+# Cabeçalho da exportação do Metabase, separado por vírgulas. Quando definido, o arquivo precisa ter
+# esse cabeçalho ou o dos rótulos do painel (snapshots antigos, regravados com as colunas renomeadas),
+# sem diferenciar maiúsculas. Sem ele, só o número de colunas é exigido (as colunas são lidas por
+# posição) e um cabeçalho diferente do último snapshot aprovado é registrado como aviso.
+CABECALHO_CSV = os.environ.get('PNP_CABECALHO_CSV', '')
+
+# Variação máxima em relação ao processamento anterior (0.5 = 50%; 0 desativa a verificação).
+# Uma variação no número de linhas indica exportação truncada ou duplicada e reprova o snapshot;
+# no total de inconsistências é só um aviso, pois o total muda legitimamente (ex.: a entrada
+# das matrículas de um novo ciclo).
+VARIACAO_MAXIMA = float(os.environ.get('PNP_VALIDACAO_VARIACAO_MAXIMA', 0.5))
+
+# Exemplos listados por verificação no relatório
+MAX_EXEMPLOS = 5
+
+# Resultado da validação de um snapshot
+@dataclass
+class Validacao:
+    data_processamento: date
+    arquivo: str
+    cabecalho: list = field(default_factory=list)
+    linhas: int = 0
+    erros: list = field(default_factory=list)
+    avisos: list = field(default_factory=list)
+
+    @property
+    def aprovada(self):
+        return not self.erros
+
+# Snapshot reprovado na validação
+class SnapshotInvalido(Exception):
+    def __init__(self, validacao):
+        super().__init__("; ".join(validacao.erros))
+        self.validacao = validacao
+
+# Function to create the validation log table if it does not exist
+def criar_tabela_validacoes(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS pnp_validacoes (
+        "Data do Processamento" DATE,
+        arquivo VARCHAR,
+        hash VARCHAR,
+        cabecalho VARCHAR[],
+        linhas BIGINT,
+        aprovada BOOLEAN,
+        erros VARCHAR[],
+        avisos VARCHAR[],
+        validado_em TIMESTAMP
+    )
+    """)
+
+# Function to record a validation in the log
+def registrar_validacao(conn, validacao, hash_atual=None):
+    conn.execute("""
+    INSERT INTO pnp_validacoes VALUES (?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
+    """, [validacao.data_processamento, os.path.basename(validacao.arquivo), hash_atual, validacao.cabecalho,
+          validacao.linhas, validacao.aprovada, validacao.erros, validacao.avisos])
+
+def _exemplos(valores):
+    exemplos = ", ".join(repr(valor) for valor in valores[:MAX_EXEMPLOS])
+    return exemplos + (", ..." if len(valores) > MAX_EXEMPLOS else "")
+
+def _normalizar(cabecalho):
+    return [coluna.strip().lower() for coluna in cabecalho]
+
+# Function to check the header against the configured one (error) or, when none is configured,
+# against the header of the latest approved snapshot (warning)
+def _verificar_cabecalho(conn, validacao):
+    if CABECALHO_CSV:
+        aceitos = [CABECALHO_CSV.split(','), COLUNAS]
+        if _normalizar(validacao.cabecalho) not in [_normalizar(aceito) for aceito in aceitos]:
+            validacao.erros.append(f"cabeçalho {validacao.cabecalho} diferente dos aceitos "
+                                   f"{' ou '.join(str(_normalizar(aceito)) for aceito in aceitos)}")
+        return
+    if conn.execute("SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'pnp_validacoes'").fetchone()[0] == 0:
+        return
+    anterior = conn.execute("""
+        SELECT cabecalho FROM pnp_validacoes WHERE aprovada ORDER BY validado_em DESC LIMIT 1
+    """).fetchone()
+    if anterior is not None and _normalizar(validacao.cabecalho) != _normalizar(anterior[0]):
+        validacao.avisos.append(f"cabeçalho {validacao.cabecalho} diferente do último snapshot aprovado {anterior[0]}")
+
+# Function to compare the volume of the snapshot with the previous processing date
+def _verificar_volume(conn, validacao, total):
+    if not VARIACAO_MAXIMA:
+        return
+    anterior = conn.execute("""
+        SELECT "Data do Processamento", COUNT(*), SUM("Total de Inconsistências")
+        FROM pnp_agregado_unidade
+        WHERE "Data do Processamento" = (SELECT MAX("Data do Processamento") FROM pnp_agregado_unidade
+                                         WHERE "Data do Processamento" < ?)
+        GROUP BY 1
+    """, [validacao.data_processamento]).fetchone()
+    if anterior is None:
+        return
+    data_anterior, linhas_anteriores, total_anterior = anterior
+    for descricao, atual, previo, destino in (
+            ('linhas', validacao.linhas, linhas_anteriores, validacao.erros),
+            ('total de inconsistências', total or 0, total_anterior or 0, validacao.avisos)):
+        if previo and abs(atual - previo) / previo > VARIACAO_MAXIMA:
+            destino.append(
+                f"variação de {(atual - previo) / previo:+.0%} em {descricao} em relação a "
+                f"{data_anterior:%d/%m/%Y} ({previo} -> {atual})")
+
+# Function to validate a snapshot file inside DuckDB: header, types, vocabularies, non-negative
+# totals, duplicate keys and day-over-day volume. When approved, the typed rows are left in
+# the temp table `tabela` for the load.
+def validar_snapshot(conn, csv_path, data_processamento, tabela='carga'):
+    validacao = Validacao(data_processamento, csv_path)
+
+    # Cabeçalho: somente a primeira linha do arquivo
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        validacao.cabecalho = [coluna.strip() for coluna in next(csv.reader(f), [])]
+    if len(validacao.cabecalho) != len(COLUNAS):
+        validacao.erros.append(f"cabeçalho com {len(validacao.cabecalho)} coluna(s), esperadas {len(COLUNAS)}")
+    else:
+        _verificar_cabecalho(conn, validacao)
+    if validacao.erros:
+        return validacao
+
+    # Leitura sem conversão de tipos, para que valores inválidos sejam contados e não interrompam a leitura
+    try:
+        conn.execute("""
+        CREATE OR REPLACE TEMP TABLE validacao_bruta AS
+            SELECT * FROM read_csv(?, header = true, auto_detect = false, delim = ',', quote = '"', columns = ?)
+        """, [csv_path, {coluna: 'VARCHAR' for coluna in COLUNAS}])
+    except duckdb.Error as e:
+        validacao.erros.append(f"arquivo malformado: {e}")
+        return validacao
+
+    linhas, nulos, invalidos, negativos, total = conn.execute("""
+        SELECT COUNT(*),
+               COUNT(*) FILTER (WHERE "Instituição" IS NULL OR "Unidade" IS NULL OR "Escopo da Inconsistência" IS NULL
+                                   OR "Situação da Inconsistência" IS NULL OR "Total de Inconsistências" IS NULL),
+               COUNT(*) FILTER (WHERE "Total de Inconsistências" IS NOT NULL
+                                  AND TRY_CAST("Total de Inconsistências" AS INTEGER) IS NULL),
+               COUNT(*) FILTER (WHERE TRY_CAST("Total de Inconsistências" AS INTEGER) < 0),
+               SUM(TRY_CAST("Total de Inconsistências" AS INTEGER))
+        FROM validacao_bruta
+    """).fetchone()
+    validacao.linhas = linhas
+    if linhas == 0:
+        validacao.erros.append("arquivo sem linhas")
+    if nulos:
+        validacao.erros.append(f"{nulos} linha(s) com valores vazios")
+    if invalidos:
+        validacao.erros.append(f"{invalidos} total(is) não inteiro(s)")
+    if negativos:
+        validacao.erros.append(f"{negativos} total(is) negativo(s)")
+
+    for coluna, validos in (('Escopo da Inconsistência', ESCOPOS_VALIDOS),
+                            ('Situação da Inconsistência', SITUACOES_VALIDAS)):
+        desconhecidos = [linha[0] for linha in conn.execute(f"""
+            SELECT DISTINCT "{coluna}" FROM validacao_bruta
+            WHERE "{coluna}" IS NOT NULL AND "{coluna}" NOT IN (SELECT unnest(?))
+            ORDER BY 1
+        """, [list(validos)]).fetchall()]
+        if desconhecidos:
+            validacao.erros.append(f"{coluna} fora do vocabulário: {_exemplos(desconhecidos)}")
+
+    duplicadas = conn.execute("""
+        SELECT COUNT(*), MIN(chave)
+        FROM (
+            SELECT concat_ws(' / ', "Unidade", "Escopo da Inconsistência", "Situação da Inconsistência") AS chave
+            FROM validacao_bruta
+            GROUP BY "Instituição", "Unidade", "Escopo da Inconsistência", "Situação da Inconsistência"
+            HAVING COUNT(*) > 1
+        )
+    """).fetchone()
+    if duplicadas[0]:
+        validacao.erros.append(f"{duplicadas[0]} chave(s) duplicada(s), por exemplo {duplicadas[1]!r}")
+
+    # Comparações com os dados já carregados (ausentes em bancos ainda não migrados)
+    if tabelas_agregadas_existem(conn):
+        _verificar_volume(conn, validacao, total)
+        novas = conn.execute("""
+            SELECT COUNT(*) FROM (SELECT DISTINCT "Instituição", "Unidade" FROM validacao_bruta) o
+            ANTI JOIN (SELECT "Instituição", "Unidade" FROM dim_unidade JOIN dim_instituicao USING (instituicao_id)) d
+                ON o."Instituição" IS NOT DISTINCT FROM d."Instituição" AND o."Unidade" IS NOT DISTINCT FROM d."Unidade"
+        """).fetchone()[0]
+        if novas:
+            validacao.avisos.append(f"{novas} unidade(s) nova(s)")
+
+    if validacao.aprovada:
+        conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {tabela} AS
+            SELECT * REPLACE (CAST("Total de Inconsistências" AS INTEGER) AS "Total de Inconsistências")
+            FROM validacao_bruta
+        """)
+    conn.execute("DROP TABLE validacao_bruta")
+    return validacao
+
+# Function to move a rejected snapshot to the quarantine folder, with its report as JSON
+def colocar_em_quarentena(validacao, quarentena_dir):
+    os.makedirs(quarentena_dir, exist_ok=True)
+    destino = os.path.join(quarentena_dir, os.path.basename(validacao.arquivo))
+    shutil.move(validacao.arquivo, destino)
+    with open(f'{destino}.json', 'w', encoding='utf-8') as f:
+        json.dump(dict(asdict(validacao), arquivo=destino, quarentena_em=datetime.now().isoformat(timespec='seconds')),
+                  f, ensure_ascii=False, indent=2, default=str)
+    return destino
+
+# Function to format the compact report of a run, one line per validated snapshot
+def formatar_relatorio(validacoes):
+    linhas = []
+    for validacao in validacoes:
+        situacao = "OK" if validacao.aprovada else "QUARENTENA"
+        detalhes = "; ".join(validacao.erros + [f"aviso: {aviso}" for aviso in validacao.avisos])
+        linhas.append(f"{validacao.data_processamento} {os.path.basename(validacao.arquivo)} {situacao} "
+                      f"({validacao.linhas} linhas){': ' + detalhes if detalhes else ''}")
+    aprovadas = sum(validacao.aprovada for validacao in validacoes)
+    linhas.append(f"Validação: {aprovadas} aprovado(s), {len(validacoes) - aprovadas} em quarentena.")
+    return "\n".join(linhas)
+
+if __name__ == '__main__':
+    # Uso: python validacao.py data/dados-AAAA-MM-DD.csv [...] (somente valida, sem carregar)
+    from ingest import data_do_arquivo
+
+    conn = duckdb.connect(database=DB_PATH, read_only=True)
+    try:
+        validacoes = [validar_snapshot(conn, caminho, data_do_arquivo(caminho) or date.today())
+                      for caminho in sys.argv[1:]]
+        print(formatar_relatorio(validacoes))
+    finally:
+        conn.close()
@@ -0,0 +1,91 @@
+import fcntl
+import os
+import signal
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from database import DB_PATH
+from get_data_from_metabase import run_maintenance, run_pipeline
+
+# Worker de carga agendada, separado do container do dashboard.
+# Executa o pipeline diariamente no horário PNP_HORARIO_CARGA (HH:MM, hora local);
+# cada execução monta o banco em um arquivo de staging e o publica com uma troca atômica.
+HORARIO_CARGA = os.environ.get('PNP_HORARIO_CARGA', '15:17')
+TRAVA_PATH = f'{DB_PATH}.lock'
+
+_encerrar = False
+
+def _sinal_encerrar(signum, frame):
+    global _encerrar
+    _encerrar = True
+    print("Encerrando o worker de carga.")
+
+# Function to compute the next run time for a daily HH:MM schedule
+def proxima_execucao(agora, horario=HORARIO_CARGA):
+    hora, minuto = (int(parte) for parte in horario.split(':'))
+    proxima = agora.replace(hour=hora, minute=minuto, second=0, microsecond=0)
+    if proxima <= agora:
+        proxima += timedelta(days=1)
+    return proxima
+
+# Function to hold the lock shared by the loads and the maintenance commands, so that only one
+# of them builds and publishes a staging copy at a time. Yields False when the lock is taken and
+# esperar is False; otherwise waits for it.
+@contextmanager
+def trava_de_carga(trava_path=TRAVA_PATH, esperar=False):
+    with open(trava_path, 'w') as trava:
+        try:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not esperar:
+                yield False
+                return
+            print("Aguardando a carga em andamento.")
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
+
+# Function to run the pipeline unless another load holds the lock on the staging database
+def executar_carga(trava_path=TRAVA_PATH):
+    with trava_de_carga(trava_path) as obtida:
+        if not obtida:
+            print("Outra carga está em andamento; execução ignorada.")
+            return False
+        print(f"Carga iniciada em {datetime.now().isoformat(timespec='seconds')}.")
+        run_pipeline()
+        print(f"Carga concluída em {datetime.now().isoformat(timespec='seconds')}.")
+    return True
+
+# Function to run a maintenance operation on the database (ingest, rollups, trends, archive CLIs)
+# through a staging copy, after any load in progress. Writing to the published file directly
+# would conflict with the dashboards' lock and be lost at the next swap.
+def executar_manutencao(operacao, trava_path=TRAVA_PATH):
+    with trava_de_carga(trava_path, esperar=True):
+        return run_maintenance(operacao)
+
+# Function to run the pipeline every day at the configured time until SIGTERM/SIGINT
+def agendar(horario=HORARIO_CARGA):
+    signal.signal(signal.SIGTERM, _sinal_encerrar)
+    signal.signal(signal.SIGINT, _sinal_encerrar)
+    while not _encerrar:
+        proxima = proxima_execucao(datetime.now(), horario)
+        print(f"Próxima carga em {proxima.isoformat(timespec='minutes')}.")
+        # Espera em intervalos curtos para atender o sinal de encerramento
+        while not _encerrar and datetime.now() < proxima:
+            time.sleep(min(30, max(0, (proxima - datetime.now()).total_seconds())))
+        if not _encerrar:
+            executar_carga()
+
+if __name__ == '__main__':
+    # --agora: executa uma carga ao iniciar; --uma-vez: executa uma carga e termina
+    if '--agora' in sys.argv or '--uma-vez' in sys.argv:
+        executar_carga()
+    if '--uma-vez' not in sys.argv:
+        agendar()